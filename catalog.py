@@ -0,0 +1,240 @@
+# Каталог метаданных коллекции (SQLite)
+#
+# Записи всех обработанных файлов (контрольные суммы, формат, технические
+# параметры, топография) сохраняются в индексированную базу SQLite. Отчеты по
+# всей коллекции ("все TIFF с разрешением ниже 300 dpi", дубликаты по
+# контрольной сумме) строятся запросом к базе, без повторного разбора XML.
+#
+# Использование из командной строки:
+#   python catalog.py catalog.sqlite query --format TIFF --max-dpi 300
+#   python catalog.py catalog.sqlite summary
+#   python catalog.py catalog.sqlite duplicates
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+# Записи сохраняются в базу пакетами (по умолчанию; режим наблюдения сохраняет каждую запись)
+COMMIT_EVERY = 500
+
+# Столбцы записи (кроме path) в порядке таблицы
+COLUMNS = (
+    'name', 'ext', 'size', 'mtime', 'type', 'format_name', 'mime', 'puid', 'sha1', 'gost', 'topography',
+    'width', 'height', 'dpi', 'bit_depth', 'compression', 'duration', 'page_count', 'word_count',
+    'char_count', 'encoding', 'sidecar', 'processed_at', 'metadata',
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    ext TEXT,
+    size INTEGER,
+    mtime REAL,
+    type TEXT,
+    format_name TEXT,
+    mime TEXT,
+    puid TEXT,
+    sha1 TEXT,
+    gost TEXT,
+    topography TEXT,
+    width INTEGER,
+    height INTEGER,
+    dpi REAL,
+    bit_depth INTEGER,
+    compression TEXT,
+    duration TEXT,
+    page_count INTEGER,
+    word_count INTEGER,
+    char_count INTEGER,
+    encoding TEXT,
+    sidecar TEXT,
+    processed_at REAL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_format ON files (format_name);
+CREATE INDEX IF NOT EXISTS idx_files_mime ON files (mime);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files (size);
+CREATE INDEX IF NOT EXISTS idx_files_sha1 ON files (sha1);
+CREATE INDEX IF NOT EXISTS idx_files_gost ON files (gost);
+CREATE INDEX IF NOT EXISTS idx_files_type ON files (type);
+"""
+
+
+class Catalog:
+    """Каталог метаданных в базе SQLite.
+
+    Метод add потокобезопасен (записи поступают из потоков этапа записи конвейера).
+    """
+    def __init__(self, db_path: str, commit_every: int = COMMIT_EVERY):
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Добавляет или обновляет запись о файле (ключ - путь)."""
+        record = dict(record)
+        record.setdefault('processed_at', time.time())
+        if isinstance(record.get('metadata'), dict):
+            record['metadata'] = json.dumps(record['metadata'], ensure_ascii=False)
+        values = [record['path']] + [record.get(column) for column in COLUMNS]
+        placeholders = ', '.join('?' * len(values))
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO files (path, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+                               values)
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._conn.commit()
+                self._pending = 0
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _select(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """Запись о файле по пути."""
+        rows = self._select("SELECT * FROM files WHERE path = ?", (path,))
+        return rows[0] if rows else None
+
+    def query(self, format_name: Optional[str] = None, mime: Optional[str] = None, file_type: Optional[str] = None,
+              ext: Optional[str] = None, min_size: Optional[int] = None, max_size: Optional[int] = None,
+              min_dpi: Optional[float] = None, max_dpi: Optional[float] = None, checksum: Optional[str] = None,
+              path_prefix: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Выборка записей по условиям (все условия объединяются через AND).
+
+        format_name сравнивается по началу названия формата из format_id.py: "PDF" находит
+        "PDF 1.4", "PDF 1.7" и "PDF", "GIF" - "GIF 87a" и "GIF 89a". RAW-форматы на основе TIFF
+        называются отдельно ("Canon RAW 2 (CR2)", "Nikon Electronic Format (NEF)") и по "TIFF" не находятся;
+        max_dpi - строго меньше заданного значения.
+        """
+        conditions, params = [], []
+        if format_name:
+            conditions.append("format_name LIKE ?")
+            params.append(format_name + '%')
+        if mime:
+            conditions.append("mime = ?")
+            params.append(mime)
+        if file_type:
+            conditions.append("type = ?")
+            params.append(file_type)
+        if ext:
+            conditions.append("ext = ?")
+            params.append(ext if ext.startswith('.') else '.' + ext)
+        if min_size is not None:
+            conditions.append("size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append("size <= ?")
+            params.append(max_size)
+        if min_dpi is not None:
+            conditions.append("dpi >= ?")
+            params.append(min_dpi)
+        if max_dpi is not None:
+            conditions.append("dpi < ?")
+            params.append(max_dpi)
+        if checksum:
+            conditions.append("(sha1 = ? OR gost = ?)")
+            params.extend([checksum.upper()] * 2)
+        if path_prefix:
+            conditions.append("path >= ? AND path < ?")
+            params.extend([path_prefix, path_prefix + '\U0010ffff'])
+        sql = "SELECT * FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY path"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._select(sql, params)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Распределение по форматам: количество файлов и общий объем."""
+        return self._select("SELECT format_name, mime, COUNT(*) AS files, SUM(size) AS bytes FROM files "
+                            "GROUP BY format_name, mime ORDER BY bytes DESC")
+
+    def duplicates(self) -> Iterator[List[Dict[str, Any]]]:
+        """Группы файлов с одинаковой контрольной суммой SHA1."""
+        rows = self._select("SELECT * FROM files WHERE sha1 IN "
+                            "(SELECT sha1 FROM files WHERE sha1 IS NOT NULL GROUP BY sha1 HAVING COUNT(*) > 1) "
+                            "ORDER BY sha1, path")
+        group = []
+        for row in rows:
+            if group and group[0]['sha1'] != row['sha1']:
+                yield group
+                group = []
+            group.append(row)
+        if group:
+            yield group
+
+
+def _print_rows(rows: List[Dict[str, Any]], columns: List[str]) -> None:
+    for row in rows:
+        print('\t'.join('' if row.get(column) is None else str(row[column]) for column in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Запросы к каталогу метаданных коллекции")
+    parser.add_argument('db', help="Файл базы SQLite")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query = commands.add_parser('query', help="Выборка файлов по условиям")
+    query.add_argument('--format', dest='format_name', help="Формат по сигнатуре (начало названия, например PDF или GIF)")
+    query.add_argument('--mime')
+    query.add_argument('--type', dest='file_type', help="Тип: Image, Video, Audio, PDF, Document, Generic")
+    query.add_argument('--ext', help="Расширение файла")
+    query.add_argument('--min-size', type=int, help="Минимальный размер, байт")
+    query.add_argument('--max-size', type=int, help="Максимальный размер, байт")
+    query.add_argument('--min-dpi', type=float)
+    query.add_argument('--max-dpi', type=float, help="Разрешение строго меньше значения")
+    query.add_argument('--checksum', help="Контрольная сумма SHA1 или ГОСТ")
+    query.add_argument('--path', dest='path_prefix', help="Начало пути")
+    query.add_argument('--limit', type=int)
+    query.add_argument('--json', action='store_true', help="Вывод в формате JSON")
+
+    commands.add_parser('summary', help="Распределение по форматам")
+    commands.add_parser('duplicates', help="Файлы с одинаковой контрольной суммой")
+
+    args = parser.parse_args(argv)
+    with Catalog(args.db) as catalog:
+        if args.command == 'query':
+            filters = {key: value for key, value in vars(args).items() if key not in ('db', 'command', 'json')}
+            rows = catalog.query(**filters)
+            if args.json:
+                print(json.dumps(rows, ensure_ascii=False, indent=2))
+            else:
+                _print_rows(rows, ['path', 'format_name', 'size', 'width', 'height', 'dpi', 'sha1'])
+        elif args.command == 'summary':
+            _print_rows(catalog.summary(), ['format_name', 'mime', 'files', 'bytes'])
+        elif args.command == 'duplicates':
+            for group in catalog.duplicates():
+                print(group[0]['sha1'])
+                _print_rows(group, ['path', 'size'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
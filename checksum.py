@@ -10,42 +10,274 @@
 
 import hashlib
 import os
-from functools import partial
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional
 from tqdm import tqdm
+from io_tuning import get_tuner, fadvise, DONTNEED_THRESHOLD
 
-def generate_file_checksum(file_path: str, hash_algo: str = 'GR3411_2012_256') -> tuple:
-    """Генерация контрольной суммы для файла."""
+# Размер блока чтения подбирается по точке монтирования (io_tuning.py),
+# если он не задан явно при вызове generate_file_checksums
+
+# Параллельное чтение одного большого файла диапазонами (os.pread):
+# на хранилищах с большой задержкой (NAS, SMB) один поток чтения не загружает канал
+PARALLEL_READ_THRESHOLD = 4 * 1024 * 1024 * 1024  # файлы от 4GB
+PARALLEL_READERS = 4
+
+
+class HeaderSink:
+    """Сохраняет первые байты потока (для определения формата и разбора заголовков)."""
+    def __init__(self, size: int):
+        self.size = size
+        self.data = b''
+
+    def update(self, chunk: bytes) -> None:
+        if len(self.data) < self.size:
+            self.data += chunk[:self.size - len(self.data)]
+
+
+class ContentBudget:
+    """Общий для всех заданий лимит памяти под содержимое файлов, ожидающих разбора."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, size: int) -> bool:
+        with self._lock:
+            if self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self.used = max(self.used - size, 0)
+
+
+# Между этапами конвейера ждут до QUEUE_SIZE заданий: содержимое в памяти
+# держится только в пределах общего лимита, остальные файлы разбираются по пути
+CONTENT_BUDGET = ContentBudget(512 * 1024 * 1024)  # 512MB
+
+
+class BufferSink:
+    """Сохраняет поток целиком, если файл не больше limit и есть место в общем лимите budget."""
+    def __init__(self, limit: int, budget: Optional[ContentBudget] = CONTENT_BUDGET):
+        self.limit = limit
+        self.budget = budget
+        self._chunks = []
+        self._data: Optional[bytes] = None
+        self._reserved = 0
+        self.enabled = True
+
+    def reserve(self, file_size: int) -> None:
+        """Отключает буферизацию заранее, если файл слишком большой или общий лимит исчерпан."""
+        self.release()
+        self.enabled = file_size <= self.limit and (self.budget is None or self.budget.acquire(file_size))
+        if self.enabled:
+            self._reserved = file_size
+
+    def update(self, chunk: bytes) -> None:
+        if self.enabled:
+            self._chunks.append(chunk)
+
+    @property
+    def data(self) -> Optional[bytes]:
+        """Содержимое (склеивается один раз); None, если файл не сохранен или прочитан не полностью."""
+        if not self.enabled:
+            return None
+        if self._data is None:
+            self._data = b''.join(self._chunks)
+            self._chunks = []
+        if len(self._data) != self._reserved:
+            return None
+        return self._data
+
+    def release(self) -> None:
+        """Освобождает содержимое и место в общем лимите."""
+        self._chunks = []
+        self._data = None
+        self.enabled = False
+        if self._reserved and self.budget is not None:
+            self.budget.release(self._reserved)
+        self._reserved = 0
+
+
+def _new_hasher(hash_algo: str):
+    """Создает объект хеширования. Возвращает (hasher, None) или (None, текст ошибки)."""
+    if hash_algo == 'GR3411_2012_256':
+        try:
+            import _pystribog
+        except ImportError:
+            return None, "***** install_cryptography ******"
+        return _pystribog.StribogHash(_pystribog.Hash256), None
+    if hash_algo == 'SHA1':
+        return hashlib.sha1(), None
+    return None, "***** unsupported_algorithm ******"
+
+
+def _pread_full(fd: int, size: int, offset: int) -> bytes:
+    """Читает диапазон целиком (pread может вернуть меньше запрошенного)."""
+    parts = []
+    while size > 0:
+        part = os.pread(fd, size, offset)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+        offset += len(part)
+    return b''.join(parts)
+
+
+def _drop_range(fd: int, offset: int, length: int, file_size: int, keep_edge: int) -> None:
+    """Удаляет диапазон из страничного кэша, кроме keep_edge байт в начале и в конце файла."""
+    start = max(offset, keep_edge)
+    end = min(offset + length, file_size - keep_edge)
+    if end > start:
+        fadvise(fd, start, end - start, 'POSIX_FADV_DONTNEED')
+
+
+def _iter_blocks(file_path: str, block_size: int, drop_cache: bool = False, file_size: int = 0,
+                 keep_edge: int = 0) -> Iterator[bytes]:
+    """Последовательное чтение файла блоками.
+
+    drop_cache - удалять обработанные блоки из страничного кэша (кроме keep_edge байт
+    в начале и в конце файла размером file_size).
+    """
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        fadvise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+        offset = 0
+        while True:
+            chunk = os.read(fd, block_size)
+            if not chunk:
+                break
+            yield chunk
+            if drop_cache:
+                _drop_range(fd, offset, len(chunk), file_size, keep_edge)
+            offset += len(chunk)
+    finally:
+        os.close(fd)
+
+
+def _iter_blocks_parallel(file_path: str, file_size: int, block_size: int, readers: int,
+                          drop_cache: bool = False, keep_edge: int = 0) -> Iterator[bytes]:
+    """Чтение файла упорядоченными диапазонами в несколько потоков.
+
+    Запрошенные заранее диапазоны (не более readers * 2) образуют буфер
+    переупорядочивания: блоки отдаются строго по порядку, поэтому их можно
+    передавать в последовательные алгоритмы хеширования.
+    """
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        fadvise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+        with ThreadPoolExecutor(max_workers=readers, thread_name_prefix='pread') as pool:
+            pending = deque()
+            offset = 0
+            while offset < file_size or pending:
+                while offset < file_size and len(pending) < readers * 2:
+                    pending.append((offset, pool.submit(_pread_full, fd, min(block_size, file_size - offset), offset)))
+                    offset += block_size
+                chunk_offset, future = pending.popleft()
+                chunk = future.result()
+                if not chunk:
+                    break
+                yield chunk
+                if drop_cache:
+                    _drop_range(fd, chunk_offset, len(chunk), file_size, keep_edge)
+    finally:
+        os.close(fd)
+
+
+def generate_file_checksums(file_path: str, hash_algos: Iterable[str], sinks: Iterable = (),
+                            readers: Optional[int] = None, block_size: Optional[int] = None,
+                            keep_cache: Optional[int] = 0) -> Dict[str, str]:
+    """Генерация контрольных сумм по нескольким алгоритмам за одно чтение файла.
+
+    Прочитанные блоки также передаются в sinks (объекты с методом update),
+    например для разбора заголовка или разбора изображения из памяти.
+    readers - число потоков чтения; по умолчанию файлы от PARALLEL_READ_THRESHOLD
+    читаются в PARALLEL_READERS потоков, остальные - последовательно.
+    block_size - размер блока чтения; по умолчанию подбирается по хранилищу (io_tuning.py).
+    keep_cache - сколько байт в начале и в конце большого файла оставить в страничном кэше
+    для последующего разбора (заголовки, moov, IFD); None - не удалять файл из кэша.
+    """
+    hash_algos = list(hash_algos)
+    sinks = list(sinks)
     try:
         if not os.path.isfile(file_path):
-            return hash_algo, "***** file_not_found ******"
+            return {algo: "***** file_not_found ******" for algo in hash_algos}
 
-        # Выбираем алгоритм хеширования
-        if hash_algo == 'GR3411_2012_256':
-            import _pystribog
-            import binascii
-            try:
-                hasher = _pystribog.StribogHash(_pystribog.Hash256)
-                block_size = 128 * 1024 * 1024  # 128MB блоки для GOST
-            except ImportError:
-                return hash_algo, "***** install_cryptography ******"
-        elif hash_algo == 'SHA1':
-            hasher = hashlib.sha1()
-            block_size = 64 * 1024  # 64KB блоки для SHA1
+        digests = {}
+        hashers = {}
+        for algo in hash_algos:
+            hasher, error = _new_hasher(algo)
+            if hasher is None:
+                digests[algo] = error
+            else:
+                hashers[algo] = hasher
+        consumers = [hasher.update for hasher in hashers.values()] + [sink.update for sink in sinks]
+
+        file_size = os.path.getsize(file_path)
+        tuner = get_tuner() if block_size is None else None
+        if tuner is not None:
+            block_size = tuner.block_size(file_path, file_size)
+        drop_cache = keep_cache is not None and file_size >= DONTNEED_THRESHOLD
+        if readers is None:
+            readers = PARALLEL_READERS if file_size >= PARALLEL_READ_THRESHOLD else 1
+        parallel = readers > 1 and hasattr(os, 'pread')
+        if parallel:
+            blocks = _iter_blocks_parallel(file_path, file_size, block_size, readers, drop_cache, keep_cache or 0)
         else:
-            return hash_algo, "***** unsupported_algorithm ******"
+            blocks = _iter_blocks(file_path, block_size, drop_cache, file_size, keep_cache or 0)
 
+        for sink in sinks:
+            if hasattr(sink, 'reserve'):
+                sink.reserve(file_size)
 
-        file_size = os.path.getsize(file_path)
-        with tqdm(total=file_size, unit='B', unit_scale=True, desc='Хеширование "' + os.path.basename(file_path) + '" Алгоритм: ' + hash_algo) as pbar:
-            # Чтение файла блоками по 64KB
-            with open(file_path, 'rb') as f:
-                for chunk in iter(partial(f.read, block_size), b''):
-                    hasher.update(chunk)
-                    pbar.update(len(chunk))
+        desc = 'Хеширование "' + os.path.basename(file_path) + '" Алгоритм: ' + ', '.join(hashers)
+        # Время ожидания данных (без хеширования) - для подбора размера блока
+        read_seconds = 0.0
+        bytes_read = 0
+        with tqdm(total=file_size, unit='B', unit_scale=True, desc=desc) as pbar:
+            while True:
+                started = time.perf_counter()
+                chunk = next(blocks, None)
+                read_seconds += time.perf_counter() - started
+                if chunk is None:
+                    break
+                for update in consumers:
+                    update(chunk)
+                bytes_read += len(chunk)
+                pbar.update(len(chunk))
+        if tuner is not None and not parallel:
+            # Скорость параллельного чтения несравнима с последовательной: замер не учитывается
+            tuner.record(file_path, block_size, bytes_read, read_seconds)
 
-        # Получение хеша
-        digest = hasher.hexdigest().upper()
-        return hash_algo, digest
+        # Получение хешей
+        for algo, hasher in hashers.items():
+            digests[algo] = hasher.hexdigest().upper()
+        return {algo: digests[algo] for algo in hash_algos}
 
     except Exception as e:
-        return hash_algo, f"***** error: {str(e)} ******"
\ No newline at end of file
+        return {algo: f"***** error: {str(e)} ******" for algo in hash_algos}
+
+
+def generate_data_checksums(data: bytes, hash_algos: Iterable[str]) -> Dict[str, str]:
+    """Контрольные суммы данных в памяти (например, сформированного XML перед записью)."""
+    digests = {}
+    for algo in hash_algos:
+        hasher, error = _new_hasher(algo)
+        if hasher is None:
+            digests[algo] = error
+        else:
+            hasher.update(data)
+            digests[algo] = hasher.hexdigest().upper()
+    return digests
+
+
+def generate_file_checksum(file_path: str, hash_algo: str = 'GR3411_2012_256') -> tuple:
+    """Генерация контрольной суммы для файла."""
+    return hash_algo, generate_file_checksums(file_path, [hash_algo])[hash_algo]
@@ -0,0 +1,413 @@
+# Распределенная обработка больших поступлений на нескольких узлах
+#
+# Папка задания (на общем ресурсе) содержит список файлов, разбитый на порции:
+#   manifest.json          - корневая папка, топография, число порций
+#   pending/NNNNN.jsonl    - порции, ожидающие обработки
+#   running/NNNNN@worker   - порция, занятая обработчиком (захват - атомарный rename)
+#   results/NNNNN@worker.jsonl - записи об обработанных файлах
+#   done/NNNNN.json        - порция обработана (кем)
+#
+# Обработчики на разных узлах забирают порции переименованием файла: rename
+# одного источника выполняется только одним из участников. Обработчик
+# периодически обновляет время изменения своей порции; порции без обновления
+# дольше STALE_SECONDS возвращаются в очередь. Файлы обрабатываются теми же
+# обработчиками xml_generator через конвейер (pipeline.py), результаты
+# объединяются в общий отчет и, при необходимости, в каталог (catalog.py).
+# Узлы подключают поступление по разным путям (--root), поэтому пути файлов
+# в результатах хранятся относительно корня и восстанавливаются при объединении.
+#
+# Пример:
+#   python distributed.py plan /mnt/share/job /mnt/share/delivery --topo "..."
+#   python distributed.py work /mnt/share/job --root /mnt/share/delivery   (на каждом узле)
+#   python distributed.py merge /mnt/share/job --catalog catalog.sqlite
+#   python distributed.py local /tmp/job --workers 4                      (проверка на одном узле)
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from output_writer import write_atomic, start_queue_logging
+from utils import SKIP_EXT
+
+# Порция закрывается по числу файлов или по объему
+SHARD_FILES = 500
+SHARD_BYTES = 50 * 1024 * 1024 * 1024  # 50GB
+# Период обновления отметки занятой порции и срок, после которого порция считается брошенной
+HEARTBEAT_SECONDS = 30
+STALE_SECONDS = 600
+
+MANIFEST = 'manifest.json'
+PENDING, RUNNING, RESULTS, DONE = 'pending', 'running', 'results', 'done'
+
+
+def _shard_name(index: int) -> str:
+    return f"{index:05d}"
+
+
+def _read_json(path: str) -> Any:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any) -> None:
+    write_atomic(path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def _iter_source_files(source_root: str) -> Iterator[Tuple[str, int]]:
+    """Файлы для обработки: (путь относительно корня, размер)."""
+    for roots, _, files in os.walk(source_root):
+        for file in sorted(files):
+            if file.endswith(SKIP_EXT):
+                continue
+            file_path = os.path.join(roots, file)
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                continue
+            yield os.path.relpath(file_path, source_root), size
+
+
+def plan_job(job_dir: str, source_root: str, topo: str, shard_files: int = SHARD_FILES,
+             shard_bytes: int = SHARD_BYTES) -> Dict[str, Any]:
+    """Создает задание: список файлов, разбитый на порции."""
+    for folder in (PENDING, RUNNING, RESULTS, DONE):
+        os.makedirs(os.path.join(job_dir, folder), exist_ok=True)
+    if os.path.exists(os.path.join(job_dir, MANIFEST)):
+        raise FileExistsError(f"Задание уже создано: {job_dir}")
+
+    shards, files, total_bytes = 0, 0, 0
+    shard: List[Dict[str, Any]] = []
+    shard_size = 0
+
+    def flush():
+        nonlocal shards, shard, shard_size
+        if shard:
+            data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in shard)
+            write_atomic(os.path.join(job_dir, PENDING, _shard_name(shards) + '.jsonl'), data.encode('utf-8'))
+            shards += 1
+            shard, shard_size = [], 0
+
+    for rel_path, size in _iter_source_files(source_root):
+        shard.append({'path': rel_path, 'size': size})
+        shard_size += size
+        files += 1
+        total_bytes += size
+        if len(shard) >= shard_files or shard_size >= shard_bytes:
+            flush()
+    flush()
+
+    manifest = {'root': os.path.abspath(source_root), 'topo': topo, 'shards': shards, 'files': files,
+                'bytes': total_bytes, 'created': time.time()}
+    _write_json(os.path.join(job_dir, MANIFEST), manifest)
+    return manifest
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def claim_shard(job_dir: str, worker_id: str) -> Optional[Tuple[str, str]]:
+    """Захватывает свободную порцию. Возвращает (имя порции, путь занятой порции) или None."""
+    pending_dir = os.path.join(job_dir, PENDING)
+    for file in sorted(os.listdir(pending_dir)):
+        if not file.endswith('.jsonl'):
+            continue
+        shard = file[:-len('.jsonl')]
+        running_path = os.path.join(job_dir, RUNNING, f"{shard}@{worker_id}")
+        try:
+            os.rename(os.path.join(pending_dir, file), running_path)
+        except FileNotFoundError:
+            continue  # порцию забрал другой обработчик
+        os.utime(running_path)
+        return shard, running_path
+    return None
+
+
+def requeue_stale(job_dir: str, stale_seconds: float = STALE_SECONDS) -> List[str]:
+    """Возвращает в очередь порции, отметка которых не обновлялась stale_seconds."""
+    requeued = []
+    running_dir = os.path.join(job_dir, RUNNING)
+    now = time.time()
+    for file in os.listdir(running_dir):
+        path = os.path.join(running_dir, file)
+        shard = file.split('@', 1)[0]
+        try:
+            if os.path.exists(os.path.join(job_dir, DONE, shard + '.json')):
+                # Обработчик завершил порцию, но не успел ее освободить
+                os.remove(path)
+                continue
+            if now - os.path.getmtime(path) < stale_seconds:
+                continue
+            os.rename(path, os.path.join(job_dir, PENDING, shard + '.jsonl'))
+        except OSError:
+            continue
+        logging.warning(f"Порция {shard} возвращена в очередь (обработчик {file.split('@', 1)[-1]} не отвечает)")
+        requeued.append(shard)
+    return requeued
+
+
+def _relative(path: str, root: str) -> str:
+    """Путь относительно корня поступления (в результатах порции)."""
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def _rebase(path: str, root: str) -> str:
+    """Путь из результата порции в пути корня поступления при объединении."""
+    return os.path.normpath(os.path.join(root, path))
+
+
+class _Heartbeat(threading.Thread):
+    """Обновляет время изменения занятой порции, пока она обрабатывается."""
+    def __init__(self, path: str):
+        super().__init__(daemon=True)
+        self.path = path
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                os.utime(self.path)
+            except OSError:
+                return  # порцию вернули в очередь
+
+    def stop(self):
+        self._stopped.set()
+
+
+class _ResultCollector:
+    """Собирает записи обработанных файлов (интерфейс каталога для конвейера)."""
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def commit(self) -> None:
+        pass
+
+
+def process_shard(job_dir: str, shard: str, running_path: str, worker_id: str, root: str, topo: str,
+                  **pipeline_options) -> Tuple[int, int]:
+    """Обрабатывает порцию. Возвращает (обработано, ошибок)."""
+    from pipeline import run_pipeline
+
+    with open(running_path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    def jobs():
+        for entry in entries:
+            file_path = os.path.join(root, entry['path'])
+            yield file_path, os.path.splitext(file_path)[0] + ".xml", topo
+
+    collector = _ResultCollector()
+    heartbeat = _Heartbeat(running_path)
+    heartbeat.start()
+    try:
+        failures = run_pipeline(jobs(), catalog=collector, **pipeline_options)
+    finally:
+        heartbeat.stop()
+
+    for record in collector.records:
+        record['path'] = _relative(record['path'], root)
+        record['sidecar'] = _relative(record['sidecar'], root)
+    lines = [json.dumps({'status': 'ok', 'worker': worker_id, 'record': record}, ensure_ascii=False)
+             for record in collector.records]
+    lines += [json.dumps({'status': 'error', 'worker': worker_id, 'path': _relative(job.file_path, root),
+                          'error': str(job.error)}, ensure_ascii=False) for job in failures]
+    write_atomic(os.path.join(job_dir, RESULTS, f"{shard}@{worker_id}.jsonl"),
+                 ''.join(line + '\n' for line in lines).encode('utf-8'))
+    # Сначала отметка о завершении (атомарно), затем освобождение порции: при сбое между
+    # этими шагами порция считается завершенной, а занятая порция удаляется при проверке
+    _write_json(os.path.join(job_dir, DONE, shard + '.json'), {'worker': worker_id, 'finished': time.time(),
+                                                               'files': len(entries), 'failures': len(failures)})
+    try:
+        os.remove(running_path)
+    except FileNotFoundError:
+        # Порцию вернули в очередь как брошенную: результат сохранен, повторная обработка не нужна
+        logging.warning(f"Порция {shard} была возвращена в очередь до завершения обработки")
+        try:
+            os.remove(os.path.join(job_dir, PENDING, shard + '.jsonl'))
+        except OSError:
+            pass
+    return len(collector.records), len(failures)
+
+
+def run_worker(job_dir: str, worker_id: Optional[str] = None, root: Optional[str] = None,
+               **pipeline_options) -> Tuple[int, int]:
+    """Обрабатывает порции задания, пока они есть. Возвращает (обработано файлов, ошибок)."""
+    worker_id = worker_id or default_worker_id()
+    manifest = _read_json(os.path.join(job_dir, MANIFEST))
+    root = root or manifest['root']
+    processed = failed = 0
+    while True:
+        claimed = claim_shard(job_dir, worker_id)
+        if claimed is None:
+            if not requeue_stale(job_dir):
+                break
+            continue
+        shard, running_path = claimed
+        logging.info(f"Обработчик {worker_id}: порция {shard}")
+        ok, errors = process_shard(job_dir, shard, running_path, worker_id, root, manifest['topo'],
+                                   **pipeline_options)
+        processed += ok
+        failed += errors
+    return processed, failed
+
+
+def job_status(job_dir: str) -> Dict[str, int]:
+    """Число порций в каждом состоянии."""
+    manifest = _read_json(os.path.join(job_dir, MANIFEST))
+    status = {'shards': manifest['shards'], 'files': manifest['files'], 'bytes': manifest['bytes']}
+    for folder in (PENDING, RUNNING, DONE):
+        status[folder] = len(os.listdir(os.path.join(job_dir, folder)))
+    return status
+
+
+def done_shards(job_dir: str) -> Dict[str, str]:
+    """Завершенные порции: имя порции -> обработчик, чей результат используется."""
+    done = {}
+    for file in sorted(os.listdir(os.path.join(job_dir, DONE))):
+        if not file.endswith('.json'):
+            continue
+        shard = file[:-len('.json')]
+        try:
+            done[shard] = _read_json(os.path.join(job_dir, DONE, file))['worker']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"Поврежденная отметка о завершении порции {shard}: {e}")
+    return done
+
+
+def iter_results(job_dir: str, done: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, Any]]:
+    """Результаты завершенных порций (по одному результату на порцию)."""
+    for shard, worker in (done_shards(job_dir) if done is None else done).items():
+        with open(os.path.join(job_dir, RESULTS, f"{shard}@{worker}.jsonl"), encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def merge_results(job_dir: str, report_path: Optional[str] = None, catalog_path: Optional[str] = None,
+                  root: Optional[str] = None) -> Dict[str, Any]:
+    """Объединяет результаты в общий отчет (JSON) и, если задан, в каталог SQLite.
+
+    Пути файлов восстанавливаются относительно root (по умолчанию - корень из manifest.json).
+    """
+    root = root or _read_json(os.path.join(job_dir, MANIFEST))['root']
+    catalog = None
+    if catalog_path:
+        from catalog import Catalog
+        catalog = Catalog(catalog_path)
+    summary = {'files': 0, 'bytes': 0, 'failures': [], 'formats': {}, 'workers': {}}
+    done = done_shards(job_dir)
+    try:
+        for result in iter_results(job_dir, done):
+            worker = result['worker']
+            summary['workers'][worker] = summary['workers'].get(worker, 0) + 1
+            if result['status'] != 'ok':
+                summary['failures'].append({'path': _rebase(result['path'], root), 'error': result['error']})
+                continue
+            record = result['record']
+            record['path'] = _rebase(record['path'], root)
+            if record.get('sidecar'):
+                record['sidecar'] = _rebase(record['sidecar'], root)
+            summary['files'] += 1
+            summary['bytes'] += record.get('size') or 0
+            format_name = record.get('format_name') or 'Не определено'
+            summary['formats'][format_name] = summary['formats'].get(format_name, 0) + 1
+            if catalog is not None:
+                catalog.add(record)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    summary['status'] = job_status(job_dir)
+    # Порции плана без отметки о завершении (в очереди, заняты или с поврежденной отметкой)
+    summary['missing_shards'] = [_shard_name(index) for index in range(summary['status']['shards'])
+                                 if _shard_name(index) not in done]
+    summary['complete'] = not summary['missing_shards']
+    if not summary['complete']:
+        logging.error(f"Отчет неполный: не завершено порций {len(summary['missing_shards'])} "
+                      f"из {summary['status']['shards']} (в очереди {summary['status'][PENDING]}, "
+                      f"заняты {summary['status'][RUNNING]})")
+    _write_json(report_path or os.path.join(job_dir, 'report.json'), summary)
+    return summary
+
+
+def _local_worker(job_dir: str, worker_id: str, pipeline_options: Dict[str, Any]):
+    start_queue_logging(handlers=[logging.StreamHandler()])
+    run_worker(job_dir, worker_id, **pipeline_options)
+
+
+def run_local(job_dir: str, workers: int, **pipeline_options) -> Dict[str, Any]:
+    """Обработка задания несколькими процессами на одном узле (проверка и небольшие поступления)."""
+    # Процессоры узла делятся между обработчиками: у каждого свой пул процессов разбора
+    pipeline_options.setdefault('probe_workers', max((os.cpu_count() or 2) // workers, 1))
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_local_worker, args=(job_dir, f"{default_worker_id()}-{i}", pipeline_options))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return job_status(job_dir)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Распределенная обработка файлов порциями")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan = commands.add_parser('plan', help="Создать задание из папки")
+    plan.add_argument('job_dir')
+    plan.add_argument('source')
+    plan.add_argument('--topo', default="Цифровой репозиторий - Музей истории ГУЛАГа")
+    plan.add_argument('--shard-files', type=int, default=SHARD_FILES)
+    plan.add_argument('--shard-gb', type=float, default=SHARD_BYTES / 1024 ** 3)
+
+    work = commands.add_parser('work', help="Обрабатывать порции задания")
+    work.add_argument('job_dir')
+    work.add_argument('--worker-id')
+    work.add_argument('--root', help="Путь к корню поступления на этом узле")
+
+    local = commands.add_parser('local', help="Обработать задание несколькими процессами на этом узле")
+    local.add_argument('job_dir')
+    local.add_argument('--workers', type=int, default=max((os.cpu_count() or 2) // 2, 1))
+
+    merge = commands.add_parser('merge', help="Объединить результаты в отчет")
+    merge.add_argument('job_dir')
+    merge.add_argument('--report')
+    merge.add_argument('--catalog', help="Файл каталога SQLite")
+    merge.add_argument('--root', help="Путь к корню поступления для путей в отчете и каталоге")
+
+    status = commands.add_parser('status', help="Состояние задания")
+    status.add_argument('job_dir')
+
+    args = parser.parse_args(argv)
+    start_queue_logging(handlers=[logging.StreamHandler()])
+    if args.command == 'plan':
+        manifest = plan_job(args.job_dir, args.source, args.topo, args.shard_files, int(args.shard_gb * 1024 ** 3))
+        print(f"Порций: {manifest['shards']}, файлов: {manifest['files']}, байт: {manifest['bytes']}")
+    elif args.command == 'work':
+        processed, failed = run_worker(args.job_dir, args.worker_id, args.root)
+        print(f"Обработано: {processed}, ошибок: {failed}")
+    elif args.command == 'local':
+        print(json.dumps(run_local(args.job_dir, args.workers), ensure_ascii=False))
+    elif args.command == 'merge':
+        summary = merge_results(args.job_dir, args.report, args.catalog, args.root)
+        print(f"Файлов: {summary['files']}, ошибок: {len(summary['failures'])}")
+        if not summary['complete']:
+            print(f"ВНИМАНИЕ: не завершены порции: {', '.join(summary['missing_shards'])}")
+            return 1
+    elif args.command == 'status':
+        print(json.dumps(job_status(args.job_dir), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
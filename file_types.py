@@ -0,0 +1,124 @@
+# Реестр поддерживаемых типов файлов и обработчиков
+#
+# Расширение -> тип файла определяется по словарю за O(1), словарь строится
+# один раз при регистрации. Если расширение неизвестно или не совпадает с
+# содержимым, тип определяется по сигнатуре (magic bytes) из одного чтения
+# заголовка файла (см. format_id.py).
+#
+# Подключение нового типа без правки gui.py:
+#
+#   from file_types import register_file_type
+#   from format_id import register_format, FileFormat
+#   register_file_type("models", [".ply", ".obj"], create_model_info_xml)
+#   register_format(0, b'ply\n', FileFormat("PLY", "model/x-ply", "models"))
+#
+# Обработчик вызывается как handler(file_path, save_path, topo). Формат,
+# определенный по сигнатуре, передается именованным аргументом file_format
+# только обработчикам, которые его принимают (см. call_handler): обработчики
+# с тремя параметрами, зарегистрированные ранее, продолжают работать.
+# Если указан handler_class (подкласс BaseFileHandler), конвейер pipeline.py
+# выполняет этапы хеширования, разбора и записи в отдельных пулах.
+
+import inspect
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type
+from format_id import FileFormat, identify_format, read_header
+from xml_generator import create_pdf_info_xml, create_video_info_xml, create_audio_info_xml, create_image_info_xml, create_document_info_xml
+from xml_generator import BaseFileHandler, PDFHandler, VideoHandler, AudioHandler, ImageHandler, DocumentHandler
+
+# Тип для файлов, не попавших ни в одну категорию
+UNKNOWN_TYPE = "other"
+
+# Конфигурация поддерживаемых форматов: тип -> {"extensions": [...], "handler": функция, "handler_class": класс}
+FILE_TYPES: Dict[str, Dict[str, Any]] = {}
+
+# Индекс расширение -> тип файла
+_EXTENSION_MAP: Dict[str, str] = {}
+
+
+def _normalize_extension(extension: str) -> str:
+    """Приводит расширение к виду '.ext' в нижнем регистре."""
+    extension = extension.lower()
+    return extension if extension.startswith('.') else '.' + extension
+
+
+def register_file_type(file_type: str, extensions: Iterable[str], handler: Callable[..., None],
+                       handler_class: Optional[Type[BaseFileHandler]] = None) -> None:
+    """Регистрирует тип файла: расширения, функцию-обработчик и (необязательно) класс обработчика.
+
+    При повторной регистрации без handler_class ранее указанный класс сохраняется.
+    Расширение, зарегистрированное для другого типа, переходит к file_type.
+    """
+    config = FILE_TYPES.setdefault(file_type, {"extensions": [], "handler": handler, "handler_class": None})
+    config["handler"] = handler
+    if handler_class is not None:
+        config["handler_class"] = handler_class
+    for extension in extensions:
+        extension = _normalize_extension(extension)
+        previous = _EXTENSION_MAP.get(extension)
+        if previous is not None and previous != file_type and extension in FILE_TYPES[previous]["extensions"]:
+            FILE_TYPES[previous]["extensions"].remove(extension)
+        if extension not in config["extensions"]:
+            config["extensions"].append(extension)
+        _EXTENSION_MAP[extension] = file_type
+
+
+def get_handler(file_type: str) -> Optional[Callable[..., None]]:
+    """Возвращает функцию-обработчик для типа файла."""
+    return FILE_TYPES.get(file_type, {}).get("handler")
+
+
+def get_handler_class(file_type: str) -> Optional[Type[BaseFileHandler]]:
+    """Возвращает класс обработчика для типа файла."""
+    return FILE_TYPES.get(file_type, {}).get("handler_class")
+
+
+@lru_cache(maxsize=None)
+def _accepts_file_format(handler: Callable[..., None]) -> bool:
+    try:
+        parameters = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(parameter.name == 'file_format' and parameter.kind != parameter.POSITIONAL_ONLY
+               or parameter.kind == parameter.VAR_KEYWORD for parameter in parameters)
+
+
+def call_handler(handler: Callable[..., None], file_path: str, save_path: str, topo: str,
+                 file_format: Optional[FileFormat] = None) -> None:
+    """Вызывает обработчик; file_format передается, только если обработчик его принимает."""
+    if file_format is not None and _accepts_file_format(handler):
+        handler(file_path, save_path, topo, file_format=file_format)
+    else:
+        handler(file_path, save_path, topo)
+
+
+def detect_file_type(extension: str) -> str:
+    """Определяет категорию файла по расширению."""
+    return _EXTENSION_MAP.get(_normalize_extension(extension), UNKNOWN_TYPE)
+
+
+def resolve_file(file_path: str) -> Tuple[str, Optional[FileFormat]]:
+    """Определяет категорию и формат файла по расширению с проверкой по сигнатуре."""
+    extension = Path(file_path).suffix
+    by_extension = detect_file_type(extension)
+    file_format = identify_format(read_header(file_path), extension)
+    if file_format is None or file_format.category is None:
+        return by_extension, file_format
+    if by_extension != UNKNOWN_TYPE and by_extension != file_format.category:
+        logging.warning(f"Расширение файла {file_path} не соответствует содержимому: {by_extension} -> {file_format.name}")
+    return file_format.category, file_format
+
+
+def resolve_file_type(file_path: str) -> str:
+    """Определяет категорию файла по расширению с проверкой по сигнатуре."""
+    return resolve_file(file_path)[0]
+
+
+# Встроенные типы файлов
+register_file_type("documents", [".docx", ".txt", ".rtf", ".odt"], create_document_info_xml, DocumentHandler)
+register_file_type("pdf", [".pdf"], create_pdf_info_xml, PDFHandler)
+register_file_type("photos", [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".tif", ".cr2", ".nef", ".rw2"], create_image_info_xml, ImageHandler)
+register_file_type("audio", [".mp3", ".wav", ".flac", ".aac", ".ogg", ".m4a"], create_audio_info_xml, AudioHandler)
+register_file_type("video", [".mp4", ".avi", ".mov", ".mkv", ".flv", ".wmv", ".mpeg"], create_video_info_xml, VideoHandler)
@@ -0,0 +1,174 @@
+# Идентификация формата файла по сигнатуре (magic bytes)
+#
+# Формат определяется по одному небольшому буферу из начала файла, по аналогии
+# с PRONOM: имя формата, MIME-тип и, где версия однозначно видна в заголовке,
+# идентификатор PRONOM (PUID). Результат используется и для выбора обработчика,
+# и для записи в XML.
+
+import os
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
+
+# Сколько байт читаем из начала файла (достаточно для заголовков ZIP/ODF и ISO BMFF)
+HEADER_SIZE = 512
+
+
+class FileFormat(NamedTuple):
+    """Результат идентификации формата."""
+    name: str
+    mime: str
+    category: Optional[str] = None  # категория обработчика из file_types
+    puid: Optional[str] = None      # идентификатор PRONOM
+
+
+# Уточняющая функция получает заголовок и расширение и возвращает формат
+Refiner = Callable[[bytes, str], Optional[FileFormat]]
+
+# Сигнатуры: (смещение, байты, формат или уточняющая функция)
+_SIGNATURES: List[Tuple[int, bytes, Union[FileFormat, Refiner]]] = []
+
+
+def register_format(offset: int, magic: bytes, file_format: Union[FileFormat, Refiner]) -> None:
+    """Регистрирует сигнатуру формата. Более длинные сигнатуры проверяются первыми."""
+    _SIGNATURES.append((offset, magic, file_format))
+    _SIGNATURES.sort(key=lambda signature: len(signature[1]), reverse=True)
+
+
+def identify_format(header: bytes, extension: str = '') -> Optional[FileFormat]:
+    """Определяет формат по заголовку файла. Возвращает None, если сигнатура не найдена."""
+    extension = extension.lower()
+    for offset, magic, file_format in _SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            if callable(file_format):
+                file_format = file_format(header, extension)
+                if file_format is None:
+                    continue
+            return file_format
+    return None
+
+
+def read_header(file_path: str, size: int = HEADER_SIZE) -> bytes:
+    """Читает первые байты файла."""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(size)
+    except OSError:
+        return b''
+
+
+def identify_file(file_path: str) -> Optional[FileFormat]:
+    """Определяет формат файла за одно чтение заголовка."""
+    return identify_format(read_header(file_path), os.path.splitext(file_path)[1])
+
+
+def format_label(file_format: Optional[FileFormat]) -> str:
+    """Строка для вывода: имя формата и PUID."""
+    if file_format is None:
+        return "Не определено"
+    return f"{file_format.name} ({file_format.puid})" if file_format.puid else file_format.name
+
+
+# Уточняющие функции
+
+def _jpeg(header: bytes, extension: str) -> FileFormat:
+    """JPEG: для JFIF версия указана в сегменте APP0."""
+    puid = None
+    if header[6:11] == b'JFIF\x00':
+        puid = {(1, 0): "fmt/42", (1, 1): "fmt/43", (1, 2): "fmt/44"}.get((header[11], header[12]))
+    return FileFormat("JPEG", "image/jpeg", "photos", puid)
+
+
+def _tiff(header: bytes, extension: str) -> FileFormat:
+    """TIFF и основанные на нем RAW-форматы."""
+    if header[8:10] == b'CR':
+        return FileFormat("Canon RAW 2 (CR2)", "image/x-canon-cr2", "photos", "fmt/592")
+    if extension == '.nef':
+        return FileFormat("Nikon Electronic Format (NEF)", "image/x-nikon-nef", "photos", "fmt/202")
+    return FileFormat("TIFF", "image/tiff", "photos", "fmt/353")
+
+
+def _pdf(header: bytes, extension: str) -> FileFormat:
+    """PDF: версия указана в первой строке."""
+    version = header[5:8].decode('ascii', errors='replace')
+    puid = {"1.0": "fmt/14", "1.1": "fmt/15", "1.2": "fmt/16", "1.3": "fmt/17", "1.4": "fmt/18",
+            "1.5": "fmt/19", "1.6": "fmt/20", "1.7": "fmt/276", "2.0": "fmt/1129"}.get(version)
+    return FileFormat(f"PDF {version}" if puid else "PDF", "application/pdf", "pdf", puid)
+
+
+def _riff(header: bytes, extension: str) -> Optional[FileFormat]:
+    """Контейнер RIFF: WAVE или AVI."""
+    form = header[8:12]
+    if form == b'WAVE':
+        return FileFormat("WAVE", "audio/x-wav", "audio", "fmt/6")
+    if form == b'AVI ':
+        return FileFormat("AVI", "video/x-msvideo", "video", "fmt/5")
+    return None
+
+
+# Общие brand ISO BMFF: не говорят, видео это или звук
+_GENERIC_BRANDS = frozenset((b'isom', b'iso2', b'iso3', b'iso4', b'iso5', b'iso6', b'mp41', b'mp42', b'avc1', b'dash'))
+_AUDIO_BRANDS = frozenset((b'M4A ', b'M4B '))
+
+
+def _iso_bmff(header: bytes, extension: str) -> FileFormat:
+    """ISO Base Media (MP4/MOV/M4A): тип определяется по major brand и совместимым brand."""
+    brand = header[8:12]
+    if brand == b'qt  ':
+        return FileFormat("QuickTime", "video/quicktime", "video", "x-fmt/384")
+    if brand == b'crx ':
+        return FileFormat("Canon RAW 3 (CR3)", "image/x-canon-cr3", "photos")
+    if brand in _AUDIO_BRANDS:
+        return FileFormat("MPEG-4 Audio", "audio/mp4", "audio")
+    if brand in _GENERIC_BRANDS:
+        # Общий brand (isom, mp42...) пишут и в видео, и в звук: категорию определяет расширение,
+        # совместимые brand и расширение уточняют только название формата
+        box_end = min(int.from_bytes(header[0:4], 'big'), len(header))
+        compatible = {header[offset:offset + 4] for offset in range(16, box_end - 3, 4)}
+        if compatible & _AUDIO_BRANDS or extension in ('.m4a', '.m4b'):
+            return FileFormat("MPEG-4 Audio", "audio/mp4", None)
+        return FileFormat("MPEG-4", "video/mp4", None, "fmt/199")
+    return FileFormat("MPEG-4", "video/mp4", "video", "fmt/199")
+
+
+def _zip(header: bytes, extension: str) -> FileFormat:
+    """ZIP и основанные на нем форматы документов (ODF, OOXML)."""
+    name_length = int.from_bytes(header[26:28], 'little')
+    extra_length = int.from_bytes(header[28:30], 'little')
+    first_name = header[30:30 + name_length]
+    if first_name == b'mimetype':
+        start = 30 + name_length + extra_length
+        mimetype = header[start:start + 64].split(b'PK\x03\x04')[0].decode('ascii', errors='replace')
+        if mimetype.startswith('application/vnd.oasis.opendocument.text'):
+            return FileFormat("OpenDocument Text", mimetype, "documents")
+        if mimetype.startswith('application/vnd.oasis.opendocument'):
+            return FileFormat("OpenDocument", mimetype)
+    if first_name in (b'[Content_Types].xml', b'_rels/.rels') or first_name.startswith((b'word/', b'docProps/')):
+        if extension == '.docx' or first_name.startswith(b'word/'):
+            return FileFormat("Microsoft Word (DOCX)",
+                              "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                              "documents", "fmt/412")
+        return FileFormat("Office Open XML", "application/vnd.openxmlformats-officedocument")
+    return FileFormat("ZIP", "application/zip", None, "x-fmt/263")
+
+
+# Встроенные сигнатуры
+register_format(0, b'\xff\xd8\xff', _jpeg)
+register_format(0, b'\x89PNG\r\n\x1a\n', FileFormat("PNG", "image/png", "photos"))
+register_format(0, b'GIF87a', FileFormat("GIF 87a", "image/gif", "photos", "fmt/3"))
+register_format(0, b'GIF89a', FileFormat("GIF 89a", "image/gif", "photos", "fmt/4"))
+register_format(0, b'II*\x00', _tiff)
+register_format(0, b'MM\x00*', _tiff)
+register_format(0, b'IIU\x00', FileFormat("Panasonic RAW (RW2)", "image/x-panasonic-rw2", "photos"))
+register_format(0, b'%PDF-', _pdf)
+register_format(0, b'{\\rtf', FileFormat("Rich Text Format", "application/rtf", "documents"))
+register_format(0, b'PK\x03\x04', _zip)
+register_format(0, b'RIFF', _riff)
+register_format(0, b'fLaC', FileFormat("FLAC", "audio/flac", "audio", "fmt/279"))
+register_format(0, b'OggS', FileFormat("Ogg", "application/ogg"))
+register_format(0, b'ID3', FileFormat("MP3", "audio/mpeg", "audio", "fmt/134"))
+register_format(4, b'ftyp', _iso_bmff)
+register_format(4, b'moov', FileFormat("QuickTime", "video/quicktime", "video", "x-fmt/384"))
+register_format(0, b'\x1a\x45\xdf\xa3', FileFormat("Matroska", "video/x-matroska", "video", "fmt/569"))
+register_format(0, b'FLV\x01', FileFormat("Flash Video", "video/x-flv", "video"))
+register_format(0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11', FileFormat("Advanced Systems Format (ASF/WMV)", "video/x-ms-asf", "video"))
+register_format(0, b'\x00\x00\x01\xba', FileFormat("MPEG Program Stream", "video/mpeg", "video"))
+register_format(0, b'\x00\x00\x01\xb3', FileFormat("MPEG Video", "video/mpeg", "video"))
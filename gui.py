@@ -1,50 +1,45 @@
+import json
+import logging
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinterdnd2 import DND_FILES, TkinterDnD
 from ttkthemes import ThemedStyle
-from xml_generator import create_pdf_info_xml, create_generic_info_xml, create_video_info_xml, create_audio_info_xml, create_image_info_xml, create_document_info_xml
+from xml_generator import create_generic_info_xml
+from file_types import resolve_file, get_handler, call_handler
+from pipeline import run_pipeline
+from catalog import Catalog
 from utils import *
-from pathlib import Path
-from typing import Dict
-import logging
+from output_writer import start_queue_logging
 
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Журнал пишется через очередь, не задерживая обработку файлов
+start_queue_logging('app.log')
 
 
 # Заголовок в окне программы
 TITLE = "Museum Digital File Descriptor v1.0.0 / faralex"
 
-# Исключаем из обработки при обработке директорий
-SKIP_EXT = ('.txt', '.xml')
-
-# Конфигурация поддерживаемых форматов
-FILE_TYPES: Dict[str, Dict[str, list]] = {
-    "documents": {
-        "extensions": [".docx", ".txt", ".rtf", ".odt"],
-        "handler": create_document_info_xml  # Функция для документов
-    },
-    "pdf": {
-        "extensions": [".pdf"],
-        "handler": create_pdf_info_xml  # Функция для документов
-    },
-    "photos": {
-        "extensions": [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".tif", ".cr2", ".nef", ".rw2"],
-        "handler": create_image_info_xml  # Функция для изображений
-    },
-    "audio": {
-        "extensions": [".mp3", ".wav", ".flac", ".aac", ".ogg", ".m4a"],
-        "handler": create_audio_info_xml  # Функция для аудио
-    },
-    "video": {
-        "extensions": [".mp4", ".avi", ".mov", ".mkv", ".flv", ".wmv", ".mpeg"],
-        "handler": create_video_info_xml  # Функция для видео
-    }
-}
+# Каталог метаданных общий для всей коллекции (между запусками и папками):
+# путь выбирается пользователем и запоминается в файле настроек
+DEFAULT_CATALOG = os.path.join(os.path.expanduser('~'), 'museum_catalog.sqlite')
+SETTINGS_FILE = os.path.join(os.path.expanduser('~'), '.museum_descriptor_gui.json')
+
+
+def load_settings() -> dict:
+    """Настройки программы (путь к каталогу)."""
+    try:
+        with open(SETTINGS_FILE, encoding='utf-8') as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return settings if isinstance(settings, dict) else {}
+
 
+def save_settings(settings: dict) -> None:
+    try:
+        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(settings, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить настройки: {e}")
 
 def select_source_file():
     """Выбор файла или папки в зависимости от режима."""
@@ -66,31 +61,34 @@ def select_save_path():
         save_path_entry.delete(0, tk.END)
         save_path_entry.insert(0, file_path)
 
+def select_catalog_path():
+    """Выбор файла каталога метаданных (существующий каталог дополняется)."""
+    current = catalog_entry.get()
+    file_path = filedialog.asksaveasfilename(defaultextension=".sqlite", filetypes=[("SQLite", "*.sqlite")],
+                                             initialdir=os.path.dirname(current) if current else None,
+                                             initialfile=os.path.basename(current) if current else "",
+                                             confirmoverwrite=False)
+    if file_path:
+        catalog_entry.delete(0, tk.END)
+        catalog_entry.insert(0, file_path)
+
 def process_file(file_path: str, save_path: str, topo: str) -> None:
     """Определяет тип файла и вызывает соответствующую функцию обработки."""
     try:
-        file_ext = Path(file_path).suffix.lower()
-        file_type = detect_file_type(file_ext)
+        file_type, file_format = resolve_file(file_path)
 
-        if handler := FILE_TYPES.get(file_type, {}).get("handler"):
-            handler(file_path, save_path, topo)
+        if handler := get_handler(file_type):
+            call_handler(handler, file_path, save_path, topo, file_format)
         else:
-            handle_unknown_type(file_path, save_path, topo)
+            handle_unknown_type(file_path, save_path, topo, file_format)
 
     except Exception as e:
         messagebox.showerror("Ошибка", f"Ошибка при обработке {file_path}: {e}")
 
-def detect_file_type(extension: str) -> str:
-    """Определяет категорию файла по расширению."""
-    for file_type, config in FILE_TYPES.items():
-        if extension in config["extensions"]:
-            return file_type
-    return "other"
-
-def handle_unknown_type(file_path: str, save_path: str, topo: str) -> None:
+def handle_unknown_type(file_path: str, save_path: str, topo: str, file_format=None) -> None:
     """Обработка файлов неизвестного типа."""
     # Реализация для других файлов
-    create_generic_info_xml(file_path, save_path, topo)
+    create_generic_info_xml(file_path, save_path, topo, file_format)
     # Или можно генерировать ошибку:
     # raise ValueError(f"Unsupported file type: {Path(file_path).suffix}")
 
@@ -102,28 +100,40 @@ def count_files(folder_path):
         for file in files if not file.endswith(SKIP_EXT)
     )
 
-def process_folder(folder_path, save_folder_path, topo):
+def process_folder(folder_path, save_folder_path, topo, catalog_path=None):
     """Обрабатывает файлы в папке, создавая XML."""
     total_files = count_files(folder_path)
     current_files = 0
 
-    for roots, _, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith(SKIP_EXT):
-                continue  # Пропуск ненужных файлов
+    def collect_jobs():
+        for roots, _, files in os.walk(folder_path):
+            for file in files:
+                if file.endswith(SKIP_EXT):
+                    continue  # Пропуск ненужных файлов
 
-            file_path = os.path.join(roots, file)
-            save_path = os.path.splitext(file_path)[0] + ".xml"
+                file_path = os.path.join(roots, file)
+                save_path = os.path.splitext(file_path)[0] + ".xml"
 
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            process_file(file_path, save_path, topo)
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                yield file_path, save_path, topo
 
-            current_files += 1
-            progress = (current_files / total_files) * 100
-            progress_bar['value'] = progress
-            progress_label.config(text=f"Обработано: {current_files} / {total_files} файлов")
-            root.update_idletasks()
+    def on_done(job):
+        nonlocal current_files
+        current_files += 1
+        progress = (current_files / total_files) * 100
+        progress_bar['value'] = progress
+        progress_label.config(text=f"Обработано: {current_files} / {total_files} файлов")
+        root.update_idletasks()
 
+    catalog = Catalog(catalog_path) if catalog_path else None
+    try:
+        failures = run_pipeline(collect_jobs(), on_done=on_done, catalog=catalog)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    if failures:
+        details = "\n".join(f"{job.file_path}: {job.error}" for job in failures[:20])
+        messagebox.showerror("Ошибка", f"Не удалось обработать файлов: {len(failures)}\n{details}")
 
 
 def on_generate_click():
@@ -136,9 +146,19 @@ def on_generate_click():
         messagebox.showwarning("Предупреждение", "Выберите файл/папку и путь сохранения.")
         return
 
+    catalog_path = catalog_entry.get().strip() if catalog_var.get() and folder_var.get() else None
+    if catalog_var.get() and folder_var.get() and not catalog_path:
+        messagebox.showwarning("Предупреждение", "Выберите файл каталога метаданных.")
+        return
+    if catalog_path:
+        settings = load_settings()
+        if settings.get('catalog') != catalog_path:
+            settings['catalog'] = catalog_path
+            save_settings(settings)
+
     progress_bar['value'] = 0
     if folder_var.get():
-        process_folder(source_file, os.path.dirname(save_path), topo)
+        process_folder(source_file, os.path.dirname(save_path), topo, catalog_path)
         messagebox.showinfo("Успешно", f"Сгенерированы XML для папки {save_path}.")
     else:
         process_file(source_file, save_path, topo)
@@ -157,7 +177,7 @@ def on_drop(event):
 
 def start_gui():
     """Запуск графического интерфейса."""
-    global root, source_file_entry, save_path_entry, folder_var, progress_bar, progress_label, topo_entry
+    global root, source_file_entry, save_path_entry, folder_var, catalog_var, catalog_entry, progress_bar, progress_label, topo_entry
 
     root = TkinterDnD.Tk()
     root.title(TITLE)
@@ -194,14 +214,24 @@ def start_gui():
     folder_var = tk.BooleanVar()
     ttk.Checkbutton(main_frame, text="Обрабатывать файлы во всех подпапках", variable=folder_var).grid(row=3, column=0, columnspan=3, pady=5)
 
+    # Запись метаданных папки в общий каталог SQLite
+    catalog_var = tk.BooleanVar()
+    ttk.Checkbutton(main_frame, text="Сохранять метаданные в каталог коллекции", variable=catalog_var).grid(row=4, column=0, columnspan=3, pady=5)
+
+    ttk.Label(main_frame, text="Каталог:").grid(row=5, column=0, sticky=tk.W)
+    catalog_entry = ttk.Entry(main_frame, width=50)
+    catalog_entry.grid(row=5, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+    catalog_entry.insert(0, load_settings().get('catalog') or DEFAULT_CATALOG)
+    ttk.Button(main_frame, text="Обзор...", command=select_catalog_path).grid(row=5, column=2)
+
     # Создание метки для отображения прогресса
     progress_label = ttk.Label(main_frame, text="Обработано: 0 файлов")
-    progress_label.grid(row=4, column=0, columnspan=3, pady=5)
+    progress_label.grid(row=6, column=0, columnspan=3, pady=5)
 
     progress_bar = ttk.Progressbar(main_frame, orient="horizontal", length=400, mode="determinate")
-    progress_bar.grid(row=5, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E))
+    progress_bar.grid(row=7, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E))
 
-    ttk.Button(main_frame, text="Создать XML", command=on_generate_click).grid(row=6, column=0, columnspan=3, pady=10)
+    ttk.Button(main_frame, text="Создать XML", command=on_generate_click).grid(row=8, column=0, columnspan=3, pady=10)
 
     main_frame.grid_rowconfigure(0, weight=1)
     main_frame.grid_columnconfigure(1, weight=1)
@@ -0,0 +1,172 @@
+# Подбор размера блока чтения для хеширования
+#
+# Оптимальный размер блока зависит от хранилища (SSD, дисковый массив, SMB).
+# Для каждой точки монтирования измеряется скорость чтения при разных размерах
+# блока, выбирается самый быстрый; результаты сохраняются в JSON-файл и
+# используются при следующих запусках. Пока замеров мало, размеры блока
+# перебираются по очереди, затем изредка перепроверяются.
+#
+# Подсказки ядру (posix_fadvise): SEQUENTIAL - увеличенное упреждающее чтение,
+# DONTNEED - прочитанные страницы большого файла удаляются из кэша, чтобы
+# хеширование не вытесняло из памяти все остальное. Области, которые затем
+# читает разбор (начало и конец медиафайла, изображение целиком), остаются в
+# кэше до окончания разбора.
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+from utils import get_mount
+
+# Размеры блока, из которых выбирается лучший
+BLOCK_SIZES = (1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024  # 16MB
+# Замер учитывается только для файлов от этого размера
+MIN_SAMPLE_BYTES = 64 * 1024 * 1024  # 64MB
+# Замеров каждого размера до выбора лучшего
+MIN_SAMPLES = 2
+# Каждый EXPLORE_EVERY-й замер выполняется с соседним размером блока
+EXPLORE_EVERY = 20
+# Вес нового замера в скользящем среднем скорости
+SMOOTHING = 0.3
+# Файлы от этого размера не оставляют прочитанные страницы в кэше
+DONTNEED_THRESHOLD = 256 * 1024 * 1024  # 256MB
+# Результаты подбора сохраняются не чаще, чем раз в столько секунд
+SAVE_INTERVAL = 30
+
+TUNING_FILE = os.path.join(os.path.expanduser('~'), '.museum_descriptor_io.json')
+
+
+@lru_cache(maxsize=1024)
+def _mount_point(folder_path: str) -> str:
+    return get_mount(folder_path)[0]
+
+
+def fadvise(fd: int, offset: int, length: int, advice_name: str) -> None:
+    """posix_fadvise, если доступен (не на Windows и macOS)."""
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def drop_file_cache(file_path: str) -> None:
+    """Удаляет страницы большого файла из кэша (после разбора, когда файл больше не нужен)."""
+    try:
+        if os.path.getsize(file_path) < DONTNEED_THRESHOLD:
+            return
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    except OSError:
+        return
+    try:
+        fadvise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+    finally:
+        os.close(fd)
+
+
+class IoTuner:
+    """Подбор размера блока чтения по точкам монтирования."""
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or TUNING_FILE
+        self._lock = threading.Lock()
+        self._mounts: Dict[str, dict] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for mount_point, state in data.get('mounts', {}).items():
+            samples = {int(size): value for size, value in state.get('samples', {}).items() if int(size) in BLOCK_SIZES}
+            self._mounts[mount_point] = {'samples': samples, 'count': state.get('count', 0)}
+
+    def save(self):
+        """Сохраняет результаты подбора (атомарная замена файла)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'mounts': {mount_point: {'block_size': self._best(state),
+                                             'samples': {str(size): value for size, value in state['samples'].items()},
+                                             'count': state['count']}
+                               for mount_point, state in self._mounts.items()}}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить параметры чтения {self.path}: {e}")
+
+    def _state(self, file_path: str) -> dict:
+        mount_point = _mount_point(os.path.dirname(os.path.abspath(file_path)))
+        return self._mounts.setdefault(mount_point, {'samples': {}, 'count': 0})
+
+    @staticmethod
+    def _best(state: dict) -> int:
+        samples = state['samples']
+        if not samples:
+            return DEFAULT_BLOCK_SIZE
+        return max(samples, key=lambda size: samples[size]['speed'])
+
+    def block_size(self, file_path: str, file_size: int) -> int:
+        """Размер блока для чтения файла."""
+        with self._lock:
+            state = self._state(file_path)
+            if file_size < MIN_SAMPLE_BYTES:
+                # Замер не будет учтен - используем лучший известный размер
+                return min(self._best(state), max(file_size, BLOCK_SIZES[0]))
+            # Перебор размеров, по которым еще мало замеров
+            for size in BLOCK_SIZES:
+                if state['samples'].get(size, {}).get('n', 0) < MIN_SAMPLES:
+                    return size
+            best = self._best(state)
+            if state['count'] % EXPLORE_EVERY == EXPLORE_EVERY - 1:
+                # Перепроверка соседнего размера (характеристики хранилища могут меняться)
+                index = BLOCK_SIZES.index(best)
+                neighbours = BLOCK_SIZES[max(index - 1, 0):index] + BLOCK_SIZES[index + 1:index + 2]
+                return neighbours[(state['count'] // EXPLORE_EVERY) % len(neighbours)]
+            return best
+
+    def record(self, file_path: str, block_size: int, bytes_read: int, read_seconds: float) -> None:
+        """Учитывает замер скорости чтения (время ожидания данных, без хеширования)."""
+        if bytes_read < MIN_SAMPLE_BYTES or read_seconds <= 0 or block_size not in BLOCK_SIZES:
+            return
+        speed = bytes_read / read_seconds
+        with self._lock:
+            state = self._state(file_path)
+            sample = state['samples'].setdefault(block_size, {'speed': speed, 'n': 0})
+            if sample['n']:
+                sample['speed'] = (1 - SMOOTHING) * sample['speed'] + SMOOTHING * speed
+            sample['n'] += 1
+            state['count'] += 1
+            self._dirty = True
+            save = time.monotonic() - self._saved_at >= SAVE_INTERVAL
+        if save:
+            self.save()
+
+
+_tuner: Optional[IoTuner] = None
+_tuner_lock = threading.Lock()
+
+
+def get_tuner() -> IoTuner:
+    """Общий для процесса объект подбора (сохраняется при выходе)."""
+    global _tuner
+    with _tuner_lock:
+        if _tuner is None:
+            _tuner = IoTuner()
+            atexit.register(_tuner.save)
+        return _tuner
@@ -1,16 +1,25 @@
 # Извлечение метаданных медиафайлов
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from wand.image import Image as WandImage
 from wand.exceptions import WandException
 from pymediainfo import MediaInfo
 import os
+import struct
 import chardet
+from tiff_header import read_tiff_pages, read_raw_info, TiffFormatError, PHOTOMETRIC_NAMES
+from text_stats import count_docx_text, count_odt_text, count_rtf_text
 
 # Константы
 _UNKNOWN = "unknown"
 _SIZE_FORMAT = "{:.2f} x {:.2f}"
 
+# RAW-форматы на основе TIFF: при разборе из памяти ImageMagick нужна подсказка формата
+_RAW_EXTENSIONS = ('cr2', 'nef', 'rw2')
+
+# Сигнатуры TIFF и BigTIFF
+_TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
 # Словарь для сопоставления типов сжатия с описанием
 COMPRESSION_MAP = {
     'undefined': "Не определено",
@@ -37,12 +46,148 @@ COMPRESSION_MAP = {
     'zips': "ZIPS (без потерь)"
 }
 
-def get_image_info(file_path: str) -> Dict[str, Any]:
+def _format_resolution(width: int, height: int, dpi_x: float, dpi_y: float) -> Tuple[str, str]:
+    """Возвращает строки DPI и размера при печати (см)."""
+    if not (dpi_x and dpi_y and width and height):
+        return _UNKNOWN, _UNKNOWN
+    return f"{dpi_x:.0f} x {dpi_y:.0f}", f"{width / dpi_x * 2.54:.2f} x {height / dpi_y * 2.54:.2f}"
+
+
+def _read_image_header(file_path: str, blob: Optional[bytes]) -> bytes:
+    if blob:
+        return blob[:16]
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(16)
+    except OSError:
+        return b''
+
+
+def get_tiff_info(file_path: str, blob: Optional[bytes] = None) -> Dict[str, Any]:
+    """Извлекает метаданные TIFF (в том числе многостраничных и пирамидальных) из заголовков IFD.
+
+    Страницы не декодируются: для каждой читаются только размеры, сжатие и глубина.
+    """
+    structure = read_tiff_pages(blob if blob else file_path)
+    main_pages = [page for page in structure['pages'] if not page['reduced']] or structure['pages']
+    first = main_pages[0]
+
+    dpi_x, dpi_y = first['x_resolution'], first['y_resolution']
+    if first['resolution_unit'] == 3:  # пиксели на сантиметр
+        dpi_x, dpi_y = (dpi_x or 0) * 2.54, (dpi_y or 0) * 2.54
+    dpi_str, print_size = _format_resolution(first['width'], first['height'], dpi_x, dpi_y)
+
+    pages = []
+    for index, page in enumerate(structure['pages'], start=1):
+        pages.append({
+            "index": index,
+            "width_px": page['width'],
+            "height_px": page['height'],
+            "compression": COMPRESSION_MAP.get(page['compression'], page['compression']),
+            "bit_depth": f"{page['bits_per_sample']} bit",
+            "reduced": page['reduced'],
+            "levels": [(level['width'], level['height']) for level in page['levels']],
+        })
+
+    return {
+        "format": "TIFF",
+        "color_mode": PHOTOMETRIC_NAMES.get(first['photometric'], "undefined"),
+        "width_px": first['width'],
+        "height_px": first['height'],
+        "dpi": dpi_str,
+        "print_size_cm": print_size,
+        "compression": COMPRESSION_MAP.get(first['compression'], first['compression']),
+        "bit_depth": f"{first['bits_per_sample']} bit",
+        "tiff_metadata": structure['tags'] or None,
+        "page_count": len(main_pages),
+        "pages": pages,
+        "truncated": structure['truncated'],
+    }
+
+
+def _number(value: Any) -> Optional[float]:
+    """Числовое значение тега EXIF или None (тег записан строкой, байтами или списком)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _format_camera(raw: Dict[str, Any]) -> Dict[str, str]:
+    """Сведения о камере в читаемом виде. Поля с нечисловым значением пропускаются."""
+    camera = {}
+    for key in ('make', 'model'):
+        if isinstance(raw.get(key), str) and raw[key]:
+            camera[key] = raw[key]
+    exif = raw.get('camera', {})
+    if isinstance(exif.get('lens_model'), str) and exif['lens_model']:
+        camera['lens_model'] = exif['lens_model']
+    iso = _number(exif.get('iso'))
+    if iso:
+        camera['iso'] = f"{iso:g}"
+    exposure = _number(exif.get('exposure_time'))
+    if exposure and exposure > 0:
+        camera['exposure_time'] = f"1/{round(1 / exposure)} с" if exposure < 1 else f"{exposure:g} с"
+    f_number = _number(exif.get('f_number'))
+    if f_number:
+        camera['f_number'] = f"f/{f_number:.1f}"
+    focal_length = _number(exif.get('focal_length'))
+    if focal_length:
+        camera['focal_length'] = f"{focal_length:g} мм"
+    if isinstance(exif.get('date_original'), str) and exif['date_original']:
+        camera['date_original'] = exif['date_original']
+    return camera
+
+
+def get_raw_info(file_path: str, blob: Optional[bytes] = None) -> Dict[str, Any]:
+    """Извлекает метаданные RAW-файла (CR2, NEF, RW2) из заголовков TIFF и EXIF.
+
+    В отличие от ImageMagick данные сенсора не декодируются (без демозаики).
+    """
+    raw = read_raw_info(blob if blob else file_path)
+    dpi_x, dpi_y = raw['x_resolution'], raw['y_resolution']
+    if raw['resolution_unit'] == 3:  # пиксели на сантиметр
+        dpi_x, dpi_y = (dpi_x or 0) * 2.54, (dpi_y or 0) * 2.54
+    dpi_str, print_size = _format_resolution(raw['width'], raw['height'], dpi_x, dpi_y)
+    compression = raw.get('compression') or 'undefined'
+    return {
+        "format": raw['format'],
+        "color_mode": "RAW (CFA)",
+        "width_px": raw['width'],
+        "height_px": raw['height'],
+        "dpi": dpi_str,
+        "print_size_cm": print_size,
+        "compression": COMPRESSION_MAP.get(compression, compression),
+        "bit_depth": f"{raw['bit_depth']} bit" if raw.get('bit_depth') else _UNKNOWN,
+        "camera": _format_camera(raw),
+    }
+
+
+def get_image_info(file_path: str, blob: Optional[bytes] = None) -> Dict[str, Any]:
     """Извлекает метаданные изображения с использованием ImageMagick (Wand).
+
+    Если передан blob (содержимое файла, уже прочитанное при хешировании),
+    изображение разбирается из памяти без повторного чтения с диска.
+    TIFF и RAW разбираются по заголовкам без ImageMagick (см. get_tiff_info, get_raw_info).
     """
+    ext = os.path.splitext(file_path)[1][1:].lower()
+    header = _read_image_header(file_path, blob)
+    if header[:4] == b'IIU\x00' or (header[:4] in _TIFF_SIGNATURES and (header[8:10] == b'CR' or ext in _RAW_EXTENSIONS)):
+        try:
+            return get_raw_info(file_path, blob)
+        except (TiffFormatError, struct.error):
+            pass  # Поврежденная структура - пробуем ImageMagick
+    elif header[:4] in _TIFF_SIGNATURES:
+        try:
+            return get_tiff_info(file_path, blob)
+        except (TiffFormatError, struct.error):
+            pass  # Поврежденная структура - пробуем ImageMagick
 
     try:
-        with WandImage(filename=file_path) as img:
+        if blob:
+            image = WandImage(blob=blob, format=ext if ext in _RAW_EXTENSIONS else None)
+        else:
+            image = WandImage(filename=file_path)
+        with image as img:
             dpi = img.resolution  # кортеж (dpi_x, dpi_y)
             # Получаем единицы измерения (может возвращаться как строка или числовой код)
             # Если единицы заданы как 'pixelspercentimeter' или числовой код (например, 2), конвертируем в DPI
@@ -95,6 +240,17 @@ def get_media_info(file_path):
     return MediaInfo.parse(file_path)
 
 
+def get_media_tracks(file_path: str) -> List[Dict[str, Any]]:
+    """Дорожки MediaInfo в виде словарей (сериализуются для передачи из процесса разбора)."""
+    return [track.to_data() for track in MediaInfo.parse(file_path).tracks]
+
+
+def get_pdf_page_count(file_path: str) -> int:
+    """Количество страниц PDF."""
+    import PyPDF2
+    return len(PyPDF2.PdfReader(file_path).pages)
+
+
 def get_txt_meta(file_path: str) -> Dict[str, Any]:
     """Извлекает метаинформацию из текстового файла (.txt)"""
     with open(file_path, 'rb') as f:
@@ -114,63 +270,45 @@ def get_txt_meta(file_path: str) -> Dict[str, Any]:
     }
 
 def get_docx_meta(file_path: str) -> Dict[str, Any]:
-    """Извлекает метаинформацию из файла DOCX с помощью библиотеки python-docx"""
-    from docx import Document
-    doc = Document(file_path)
-    text = "\n".join(para.text for para in doc.paragraphs)
-    word_count = len(text.split())
-    char_count = len(text)
+    """Извлекает метаинформацию из файла DOCX потоковым разбором word/document.xml"""
+    stats = count_docx_text(file_path)
     return {
         'encoding': 'utf-8',
-        'word_count': word_count,
-        'char_count': char_count
+        'word_count': stats.words,
+        'char_count': stats.chars
     }
 
 def get_rtf_meta(file_path: str) -> Dict[str, Any]:
-    """Извлекает метаинформацию из RTF-файла с использованием striprtf"""
-    from striprtf.striprtf import rtf_to_text
-    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-        rtf_content = f.read()
-    text = rtf_to_text(rtf_content)
-    word_count = len(text.split())
-    char_count = len(text)
+    """Извлекает метаинформацию из RTF-файла потоковым токенизатором (картинки не декодируются)"""
+    counter = count_rtf_text(file_path)
     return {
-        'encoding': 'utf-8',
-        'word_count': word_count,
-        'char_count': char_count
+        'encoding': counter.codepage,
+        'word_count': counter.stats.words,
+        'char_count': counter.stats.chars
     }
 
-def get_paragraph_text(element) -> str:
-    """Рекурсивно извлекает текст из элемента ODF."""
-    text_content = ""
-    for node in element.childNodes:
-        # Если узел является текстовым, берем его данные
-        if node.nodeType == node.TEXT_NODE:
-            text_content += node.data
-        # Если узел имеет дочерние узлы, рекурсивно извлекаем текст
-        elif hasattr(node, "childNodes"):
-            text_content += get_paragraph_text(node)
-    return text_content
-
 def get_odt_meta(file_path: str) -> Dict[str, Any]:
-    """Извлекает метаинформацию из ODT-файла с использованием odfpy."""
-    from odf.opendocument import load
-    from odf.text import P
-    doc = load(file_path)
-    paragraphs = doc.getElementsByType(P)
-    text = "\n".join(get_paragraph_text(p) for p in paragraphs)
-    word_count = len(text.split())
-    char_count = len(text)
+    """Извлекает метаинформацию из ODT-файла потоковым разбором content.xml."""
+    stats = count_odt_text(file_path)
     return {
         'encoding': 'utf-8',
-        'word_count': word_count,
-        'char_count': char_count
+        'word_count': stats.words,
+        'char_count': stats.chars
     }
 
 
-def get_text_file_meta(file_path: str) -> Dict[str, Any]:
+# Формат по сигнатуре -> расширение парсера (чтобы не открывать файл чужим парсером)
+_DOCUMENT_FORMATS = {
+    "Microsoft Word (DOCX)": '.docx',
+    "Rich Text Format": '.rtf',
+    "OpenDocument Text": '.odt',
+}
+
+def get_text_file_meta(file_path: str, file_format=None) -> Dict[str, Any]:
     """Определяет тип текстового файла и возвращает его метаинформацию"""
     ext = os.path.splitext(file_path.lower())[1]
+    if file_format is not None and file_format.name in _DOCUMENT_FORMATS:
+        ext = _DOCUMENT_FORMATS[file_format.name]
     if ext == '.txt':
         return get_txt_meta(file_path)
     elif ext == '.docx':
@@ -0,0 +1,85 @@
+# Запись выходных файлов и журнала
+#
+# Выходные файлы (XML, файл контрольных сумм, файл для КАМИС) формируются
+# в памяти и записываются одним вызовом во временный файл, который затем
+# атомарно переименовывается: при сбое не остается недописанных описаний,
+# а на сетевых ресурсах число операций на файл минимально.
+#
+# Журнал пишется через очередь (QueueHandler + QueueListener): потоки обработки
+# не ждут записи на диск, записи сбрасываются на диск пачками.
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from typing import Iterable, Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Записывает файл целиком: временный файл в той же папке + os.replace."""
+    folder, name = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb', buffering=0) as f:
+            view = memoryview(data)
+            while view:
+                view = view[f.write(view):]
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def encode_text(text: str, encoding: str = 'utf-8') -> bytes:
+    """Кодирует текст с системными переводами строк (как при записи в текстовом режиме)."""
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    return text.encode(encoding)
+
+
+class BatchFileHandler(logging.FileHandler):
+    """Файловый журнал, сбрасывающий буфер только когда очередь записей пуста."""
+    def __init__(self, filename: str, log_queue: queue.Queue, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._queue = log_queue
+
+    def flush(self):
+        if self._queue.empty():
+            super().flush()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_queue_logging(filename: Optional[str] = None, level: int = logging.INFO,
+                        handlers: Iterable[logging.Handler] = ()) -> logging.handlers.QueueListener:
+    """Настраивает корневой журнал на запись через очередь.
+
+    filename - файл журнала (пишется пачками); handlers - дополнительные обработчики.
+    Поток записи останавливается при выходе из программы.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    log_queue = queue.Queue()
+    handlers = list(handlers)
+    if filename:
+        handlers.append(BatchFileHandler(filename, log_queue))
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
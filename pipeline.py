@@ -0,0 +1,177 @@
+# Асинхронный конвейер обработки файлов
+#
+# Обработка файла делится на этапы: хеширование (чтение с диска + CPU),
+# разбор (Wand, MediaInfo, парсеры документов) и запись выходных файлов.
+# У каждого этапа свой ограниченный пул потоков, этапы связаны очередями
+# ограниченного размера (обратное давление): пока один большой файл
+# хешируется, мелкие файлы продолжают проходить через конвейер.
+# Файлы от LARGE_FILE_THRESHOLD хешируются в отдельном пуле, чтобы не
+# занимать все потоки хеширования.
+# Разбор выполняется в пуле изолированных процессов (probe_pool.py): зависший
+# или превысивший лимит памяти разбор не останавливает обработку папки.
+# Если задан каталог (catalog.py), записи о файлах сохраняются в него на этапе записи.
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+from file_types import resolve_file, get_handler, get_handler_class, call_handler
+from catalog import Catalog
+from probe_pool import ProbePool, PROBE_MEMORY_LIMIT, PROBE_TIMEOUT
+from xml_generator import BaseFileHandler, GenericHandler
+
+# Файлы от этого размера хешируются в отдельном пуле
+LARGE_FILE_THRESHOLD = 1024 * 1024 * 1024  # 1GB
+
+# Размер очередей между этапами
+QUEUE_SIZE = 64
+
+
+class PipelineJob:
+    """Задание конвейера: один файл."""
+    def __init__(self, file_path: str, save_path: str, topo: str, probe_pool: Optional[ProbePool] = None,
+                 catalog: Optional[Catalog] = None):
+        self.file_path = file_path
+        self.save_path = save_path
+        self.topo = topo
+        self.probe_pool = probe_pool
+        self.catalog = catalog
+        self.handler: Optional[BaseFileHandler] = None
+        self._run: Optional[Callable[[], None]] = None
+        self.error: Optional[Exception] = None
+
+    def prepare(self):
+        """Определяет тип файла и создает обработчик (чтение заголовка)."""
+        file_type, file_format = resolve_file(self.file_path)
+        handler_class = get_handler_class(file_type)
+        handler = get_handler(file_type)
+        if handler_class is None and handler is not None:
+            # Обработчик без разбиения на этапы выполняется целиком на этапе разбора
+            self._run = lambda: call_handler(handler, self.file_path, self.save_path, self.topo, file_format)
+            return
+        handler_class = handler_class or GenericHandler
+        self.handler = handler_class(self.file_path, self.save_path, self.topo, file_format)
+        self.handler.analyzer.probe_pool = self.probe_pool
+
+    def hash_stage(self):
+        self.prepare()
+        if self.handler is not None:
+            self.handler.hash_stage()
+
+    def probe_stage(self):
+        if self.handler is not None:
+            self.handler.probe_stage()
+        else:
+            self._run()
+
+    def write_stage(self):
+        if self.handler is not None:
+            self.handler.write_stage()
+            if self.catalog is not None:
+                self.catalog.add(self.handler.analyzer.catalog_record())
+
+
+class PipelineScheduler:
+    """Планировщик конвейера: очереди и пулы потоков для каждого этапа."""
+    def __init__(self, hash_workers: int = 2, large_hash_workers: int = 1, probe_workers: Optional[int] = None,
+                 write_workers: int = 2, queue_size: int = QUEUE_SIZE,
+                 on_done: Optional[Callable[[PipelineJob], None]] = None, isolate_probes: bool = True,
+                 probe_memory_limit: Optional[int] = PROBE_MEMORY_LIMIT, probe_timeout: Optional[int] = PROBE_TIMEOUT,
+                 catalog: Optional[Catalog] = None):
+        probe_workers = probe_workers or os.cpu_count() or 2
+        self.on_done = on_done
+        self.catalog = catalog
+        self.probe_pool = ProbePool(probe_workers, probe_memory_limit, probe_timeout) if isolate_probes else None
+        self.failures: List[PipelineJob] = []
+        self._stages = [
+            # (имя, число обработчиков, функция этапа)
+            ('hash', hash_workers, PipelineJob.hash_stage),
+            ('hash_large', large_hash_workers, PipelineJob.hash_stage),
+            ('probe', probe_workers, PipelineJob.probe_stage),
+            ('write', write_workers, PipelineJob.write_stage),
+        ]
+        self._queue_size = queue_size
+        self._queues = {}
+        self._executors = {}
+        self._tasks = []
+
+    async def start(self):
+        """Запускает обработчики этапов."""
+        for name, workers, stage in self._stages:
+            self._queues[name] = asyncio.Queue(self._queue_size)
+            self._executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        for name, workers, stage in self._stages:
+            next_name = {'hash': 'probe', 'hash_large': 'probe', 'probe': 'write'}.get(name)
+            for _ in range(workers):
+                self._tasks.append(asyncio.create_task(self._worker(name, stage, next_name)))
+
+    async def submit(self, file_path: str, save_path: str, topo: str) -> PipelineJob:
+        """Ставит файл в очередь. Ждет, если очередь хеширования заполнена."""
+        job = PipelineJob(file_path, save_path, topo, self.probe_pool, self.catalog)
+        try:
+            large = os.path.getsize(file_path) >= LARGE_FILE_THRESHOLD
+        except OSError:
+            large = False
+        await self._queues['hash_large' if large else 'hash'].put(job)
+        return job
+
+    async def join(self):
+        """Ожидает завершения всех поставленных заданий."""
+        for name, workers, stage in self._stages:
+            await self._queues[name].join()
+
+    async def close(self):
+        """Дожидается заданий и останавливает обработчики."""
+        await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for executor in self._executors.values():
+            executor.shutdown()
+        if self.probe_pool is not None:
+            self.probe_pool.close()
+        if self.catalog is not None:
+            self.catalog.commit()
+
+    async def _worker(self, name: str, stage: Callable[[PipelineJob], None], next_name: Optional[str]):
+        loop = asyncio.get_running_loop()
+        queue = self._queues[name]
+        while True:
+            job = await queue.get()
+            try:
+                await loop.run_in_executor(self._executors[name], stage, job)
+            except Exception as e:
+                job.error = e
+                logging.error(f"Ошибка обработки файла {job.file_path}: {str(e)}")
+                self.failures.append(job)
+                self._finish(job)
+            else:
+                if next_name:
+                    await self._queues[next_name].put(job)
+                else:
+                    logging.info(f"Успешно обработан файл: {job.file_path}")
+                    self._finish(job)
+            finally:
+                queue.task_done()
+
+    def _finish(self, job: PipelineJob):
+        if job.handler is not None:
+            # Задание с ошибкой могло не дойти до разбора: содержимое файла не должно занимать лимит
+            job.handler.analyzer.release_content()
+        if self.on_done:
+            self.on_done(job)
+
+
+async def _run_pipeline(jobs: Iterable[Tuple[str, str, str]], **kwargs) -> List[PipelineJob]:
+    scheduler = PipelineScheduler(**kwargs)
+    await scheduler.start()
+    for file_path, save_path, topo in jobs:
+        await scheduler.submit(file_path, save_path, topo)
+    await scheduler.close()
+    return scheduler.failures
+
+
+def run_pipeline(jobs: Iterable[Tuple[str, str, str]], **kwargs) -> List[PipelineJob]:
+    """Обрабатывает задания (file_path, save_path, topo) конвейером. Возвращает неудачные задания."""
+    return asyncio.run(_run_pipeline(jobs, **kwargs))
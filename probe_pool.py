@@ -0,0 +1,187 @@
+# Изолированный разбор файлов в отдельных процессах
+#
+# Поврежденный TIFF или видеофайл может заставить ImageMagick или libmediainfo
+# занять десятки гигабайт памяти или зависнуть. Функции разбора (get_image_info,
+# get_media_tracks, разбор PDF и документов) выполняются в рабочих процессах
+# с ограничением памяти (RLIMIT_AS, лимиты ресурсов ImageMagick) и таймаутом.
+# Зависший или упавший процесс завершается и заменяется новым, файл считается
+# необработанным (ProbeError), обработка остальных файлов продолжается.
+# Ошибки, которые функции разбора возвращают значением ({'Error': ...}, например
+# ошибки декодирования и лимитов ImageMagick), также передаются как ProbeError.
+
+import logging
+import multiprocessing
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: RLIMIT_AS недоступен
+    resource = None
+
+# Ограничение адресного пространства рабочего процесса
+PROBE_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024  # 4GB
+# Лимиты ImageMagick (при превышении memory - кэш пикселей на диске)
+WAND_MEMORY_LIMIT = 1024 * 1024 * 1024  # 1GB
+WAND_MAP_LIMIT = 2 * 1024 * 1024 * 1024  # 2GB
+WAND_DISK_LIMIT = 16 * 1024 * 1024 * 1024  # 16GB
+# Время на разбор одного файла, секунд
+PROBE_TIMEOUT = 300
+# Процесс перезапускается после стольких заданий (утечки памяти библиотек)
+MAX_TASKS_PER_WORKER = 500
+
+
+class ProbeError(RuntimeError):
+    """Ошибка разбора файла в рабочем процессе."""
+
+
+class ProbeTimeoutError(ProbeError):
+    """Разбор файла не уложился в отведенное время."""
+
+
+def _limit_resources(memory_limit: Optional[int], timeout: Optional[int]):
+    """Ограничения ресурсов в рабочем процессе."""
+    if memory_limit and resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            memory_limit = min(memory_limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+    try:
+        from wand.resource import limits
+    except ImportError:
+        return
+    limits['memory'] = WAND_MEMORY_LIMIT
+    limits['map'] = WAND_MAP_LIMIT
+    limits['disk'] = WAND_DISK_LIMIT
+    if timeout:
+        limits['time'] = timeout
+
+
+def _worker_main(conn, memory_limit: Optional[int], timeout: Optional[int]):
+    """Цикл рабочего процесса: получает (функция, аргументы), возвращает результат."""
+    _limit_resources(memory_limit, timeout)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args, kwargs = task
+        try:
+            value = func(*args, **kwargs)
+            if isinstance(value, dict) and 'Error' in value:
+                result = ('error', 'ProbeError', value['Error'])
+            else:
+                result = ('ok', value)
+        except MemoryError:
+            result = ('error', 'MemoryError', "Превышен лимит памяти")
+        except Exception as e:
+            result = ('error', type(e).__name__, str(e))
+        conn.send(result)
+
+
+class _Worker:
+    """Рабочий процесс и канал связи с ним."""
+    def __init__(self, context, memory_limit: Optional[int], timeout: Optional[int]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit, timeout),
+                                       name='probe', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ProbePool:
+    """Пул рабочих процессов для разбора файлов.
+
+    Метод call потокобезопасен: каждый вызов занимает свободный процесс,
+    поэтому пул используется напрямую из потоков этапа разбора конвейера.
+    """
+    def __init__(self, workers: int, memory_limit: Optional[int] = PROBE_MEMORY_LIMIT,
+                 timeout: Optional[int] = PROBE_TIMEOUT, max_tasks: int = MAX_TASKS_PER_WORKER):
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        # spawn: рабочие процессы не наследуют потоки и блокировки конвейера
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(workers):
+            self._idle.put(None)  # процессы запускаются при первом использовании
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполняет func(*args, **kwargs) в рабочем процессе. Функция и результат должны сериализоваться pickle."""
+        worker = self._idle.get()
+        try:
+            if worker is None or not worker.process.is_alive() or worker.tasks >= self.max_tasks:
+                worker = self._replace(worker)
+            worker.tasks += 1
+            try:
+                worker.conn.send((func, args, kwargs))
+                if not worker.conn.poll(self.timeout):
+                    worker = self._replace(worker)
+                    raise ProbeTimeoutError(f"Разбор не завершился за {self.timeout} с")
+                result = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(1)
+                code = worker.process.exitcode
+                worker = self._replace(worker)
+                raise ProbeError(f"Рабочий процесс завершился аварийно (код {code})")
+        finally:
+            self._idle.put(worker)
+        if result[0] == 'error':
+            raise ProbeError(f"{result[1]}: {result[2]}")
+        return result[1]
+
+    def _replace(self, worker: Optional[_Worker]) -> _Worker:
+        """Останавливает процесс (если есть) и запускает новый."""
+        with self._lock:
+            if worker is not None:
+                worker.kill()
+                if worker in self._workers:
+                    self._workers.remove(worker)
+                logging.warning("Перезапуск процесса разбора")
+            if self._closed:
+                raise ProbeError("Пул процессов разбора закрыт")
+            worker = _Worker(self._context, self.memory_limit, self.timeout)
+            self._workers.append(worker)
+            return worker
+
+    def close(self):
+        """Останавливает все рабочие процессы."""
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_probe(pool: Optional[ProbePool], func: Callable, *args, **kwargs) -> Any:
+    """Выполняет функцию разбора в пуле процессов, а без пула - в текущем процессе."""
+    if pool is None:
+        return func(*args, **kwargs)
+    return pool.call(func, *args, **kwargs)
@@ -0,0 +1,292 @@
+# Записи метаданных файлов
+#
+# Компактная типизированная модель (dataclass со __slots__) для каждого типа
+# файла: общие свойства и контрольные суммы (FileRecord) и расширенные
+# свойства изображений, видео и аудио, PDF и текстовых документов. Записи не
+# содержат объектов XML: выходные файлы формируются из записи сериализаторами
+# (serializers.py), поэтому в памяти можно держать сотни тысяч записей.
+
+import re
+from dataclasses import dataclass, fields
+from typing import Any, ClassVar, Dict, Optional, Tuple
+from format_id import FileFormat
+from utils import replace_eng_with_rus, round_to_kb_or_mb, insert_spaces_from_end
+
+# Поля дорожек MediaInfo, которые попадают в описание
+MEDIA_KEYS = frozenset((
+    'format_info', 'format_url', 'format', 'other_duration', 'bit_rate', 'frame_rate', 'file_last_modification_date',
+    'width', 'height', 'other_display_aspect_ratio', 'scan_type', 'encoded_date', 'other_bit_depth',
+    'channel_s', 'channel_positions', 'sampling_rate', 'compression_mode', 'density', 'color_space', 'colour_primaries',
+    'BitRate_Mode', 'BitRate_Maximum', 'file_extension', 'other_maximum_bit_rate', 'other_language', 'other_bit_rate_mode',
+))
+
+# Элемент расширенных свойств: (тег, подпись или None, текст)
+Field = Tuple[str, Optional[str], str]
+
+
+@dataclass(slots=True)
+class FileRecord:
+    """Общие свойства файла и контрольные суммы."""
+    kind: ClassVar[str] = 'Generic'
+
+    file_path: str
+    save_path: str
+    name: str                       # имя без расширения
+    extension: str                  # расширение (для видео - по данным MediaInfo)
+    topography: str
+    size: int
+    size_text: str
+    modified: str                   # дата последнего изменения
+    file_format: Optional[FileFormat]
+    checksum: str
+    checksum_gost: str
+    hash_algo: str = 'SHA1'
+    hash_algo_gost: str = 'GR3411_2012_256'
+
+
+@dataclass(slots=True)
+class ImageRecord(FileRecord):
+    kind: ClassVar[str] = 'Image'
+
+    image_format: Optional[str] = None
+    color_mode: Optional[str] = None
+    bit_depth: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    dpi: Optional[str] = None
+    print_size_cm: Optional[str] = None
+    compression: Optional[str] = None
+    page_count: Optional[int] = None
+    # Страницы TIFF: (номер, ширина, высота, сжатие, глубина, уменьшенная копия, уровни пирамиды)
+    pages: Tuple[Tuple[int, int, int, str, str, bool, Tuple[Tuple[int, int], ...]], ...] = ()
+    truncated: bool = False
+    camera: Tuple[Tuple[str, str], ...] = ()
+    tiff_metadata: Any = None
+
+
+@dataclass(slots=True)
+class MediaTrack:
+    """Дорожка MediaInfo: тип и элементы описания в порядке вывода."""
+    track_type: str
+    fields: Tuple[Field, ...]
+
+
+@dataclass(slots=True)
+class VideoRecord(FileRecord):
+    kind: ClassVar[str] = 'Video'
+
+    tracks: Tuple[MediaTrack, ...] = ()
+    duration: Optional[str] = None
+    fps: Optional[str] = None
+    format_general: Optional[str] = None
+    format_video: Optional[str] = None
+    format_audio: Optional[str] = None
+    format_info_video: Optional[str] = None
+    format_info_audio: Optional[str] = None
+    encoded_date: Optional[str] = None
+    bitrate_video: Optional[str] = None
+    bitrate_audio: Optional[str] = None
+    width: Optional[str] = None
+    height: Optional[str] = None
+    sampling_rate: Optional[str] = None
+    channels: Optional[str] = None
+    channel_positions: Optional[str] = None
+    compression: Optional[str] = None
+    compression_video: Optional[str] = None
+    compression_audio: Optional[str] = None
+    color_space: Optional[str] = None
+    bit_depth: Optional[str] = None
+
+
+@dataclass(slots=True)
+class AudioRecord(VideoRecord):
+    kind: ClassVar[str] = 'Audio'
+
+
+@dataclass(slots=True)
+class PdfRecord(FileRecord):
+    kind: ClassVar[str] = 'PDF'
+
+    total_pages: Optional[int] = None
+
+
+@dataclass(slots=True)
+class DocumentRecord(FileRecord):
+    kind: ClassVar[str] = 'Document'
+
+    encoding: Optional[str] = None
+    word_count: Optional[int] = None
+    char_count: Optional[int] = None
+
+
+def base_values(record: FileRecord) -> Dict[str, Any]:
+    """Значения общих полей записи (для создания записи конкретного типа)."""
+    return {f.name: getattr(record, f.name) for f in fields(FileRecord)}
+
+
+def _check_probe(record: FileRecord, result: Dict[str, Any]):
+    """Функции разбора сообщают об ошибке значением {'Error': ...}: файл не обработан."""
+    if 'Error' in result:
+        raise ValueError(f"{record.name}{record.extension}: {result['Error']}")
+
+
+def image_record(record: FileRecord, info: Dict[str, Any]) -> ImageRecord:
+    """Запись изображения по результату get_image_info."""
+    _check_probe(record, info)
+    pages = tuple((page['index'], page['width_px'], page['height_px'], str(page['compression']), page['bit_depth'],
+                   bool(page['reduced']), tuple(tuple(level) for level in page['levels']))
+                  for page in info.get('pages') or ())
+    return ImageRecord(**base_values(record),
+                       image_format=info.get('format'),
+                       color_mode=info.get('color_mode'),
+                       bit_depth=info.get('bit_depth'),
+                       width=info.get('width_px'),
+                       height=info.get('height_px'),
+                       dpi=info.get('dpi'),
+                       print_size_cm=info.get('print_size_cm'),
+                       compression=info.get('compression'),
+                       page_count=info.get('page_count'),
+                       pages=pages,
+                       truncated=bool(info.get('truncated')),
+                       camera=tuple((info.get('camera') or {}).items()),
+                       tiff_metadata=info.get('tiff_metadata'))
+
+
+def pdf_record(record: FileRecord, total_pages: int) -> PdfRecord:
+    return PdfRecord(**base_values(record), total_pages=total_pages)
+
+
+def document_record(record: FileRecord, docdata: Dict[str, Any]) -> DocumentRecord:
+    """Запись текстового документа по результату get_text_file_meta."""
+    _check_probe(record, docdata)
+    return DocumentRecord(**base_values(record), encoding=docdata.get('encoding'),
+                          word_count=docdata.get('word_count'), char_count=docdata.get('char_count'))
+
+
+def media_record(record: FileRecord, tracks, record_class=VideoRecord) -> VideoRecord:
+    """Запись видео или аудио по дорожкам MediaInfo (get_media_tracks)."""
+    media = record_class(**base_values(record))
+    media.tracks = tuple(_media_track(media, track) for track in tracks)
+    return media
+
+
+def _media_track(media: VideoRecord, track: Dict[str, Any]) -> MediaTrack:
+    """Элементы описания дорожки; сводные значения (формат, битрейт...) записываются в media."""
+    track_type = track.get('track_type')
+    items = []
+
+    def add(tag: str, label: Optional[str], text: str) -> str:
+        items.append((tag, label, text))
+        return text
+
+    for key, value in track.items():
+        if not value or str(key) not in MEDIA_KEYS:
+            continue
+        key = str(key)
+        if key == 'file_last_modification_date':
+            media.modified = str(value)
+
+        elif key == 'other_duration' and str(track_type) == 'General':
+            media.duration = add('duration', 'Продолжительность',
+                                 replace_eng_with_rus(str(value[1])) + ' (' + str(value[4]) + ')')
+
+        elif key == 'frame_rate' and str(track_type) == 'General':
+            media.fps = add('frame_rate', 'Частота кадров (FPS)', str(value) + ' кадров/сек')
+
+        elif key == 'format':
+            add(key, 'Формат', str(value))
+            if track_type == 'General':
+                media.format_general = str(value)
+            if track_type == 'Video':
+                media.format_video = str(value)
+            if track_type == 'Audio':
+                media.format_audio = str(value)
+
+        elif key == 'format_info':
+            add(key, 'Формат/Информация', str(value))
+            if track_type == 'Video':
+                media.format_info_video = str(value)
+            if track_type == 'Audio':
+                media.format_info_audio = str(value)
+
+        elif key == 'format_url':
+            if str(value) == "http://developers.videolan.org/x264.html":
+                add(key, 'Описание формата в интернете', 'https://www.videolan.org/developers/x264.html')
+            else:
+                add(key, 'Описание формата в интернете', str(value))
+
+        elif key == 'other_bit_rate_mode':
+            mode = {'Variable': 'Переменный', 'Constant': 'Постоянный'}.get(str(value[0]), str(value[0]))
+            add('bit_rate_mode', 'Вид битрейта', mode)
+
+        elif key == 'bit_rate':
+            # Ищем число в строке значения битрейта
+            number_match = re.search(r'\d+', str(value))
+            if number_match:
+                number = int(number_match.group())
+                # Битрейт в килобитах или мегабитах и точное значение с пробелами для читаемости
+                bitrate_value = f"{round_to_kb_or_mb(number)} ({insert_spaces_from_end(str(number))} бит/с)"
+                add('bit_rate', 'Битрейт', bitrate_value)
+                if track_type == 'Audio':
+                    media.bitrate_audio = bitrate_value
+                else:
+                    media.bitrate_video = bitrate_value
+
+        elif key == 'other_maximum_bit_rate':
+            add('maximum_bit_rate', 'Максимальный битрейт', str(value[0]))
+
+        elif key == 'width':
+            media.width = add(key, 'Ширина', str(value))
+
+        elif key == 'height':
+            media.height = add(key, 'Высота', str(value))
+
+        elif key == 'other_display_aspect_ratio':
+            add('display_aspect_ratio', 'Соотношение сторон дисплея', str(value[0]))
+
+        elif key == 'scan_type':
+            add(key, 'Тип развёртки', {'Progressive': 'Прогрессивная', 'Interlaced': 'Чересстрочная'}.get(str(value), str(value)))
+
+        elif key == 'encoded_date':
+            media.encoded_date = add(key, 'Дата кодирования', str(value))
+
+        elif key == 'other_language' and str(track_type) == 'Audio':
+            add('language', 'Язык', {'English': 'Английский', 'Russian': 'Русский'}.get(str(value[0]), str(value[0])))
+
+        elif key == 'sampling_rate':
+            media.sampling_rate = add(key, 'Частота дискретизации', insert_spaces_from_end(str(value)) + ' Hz')
+
+        elif key == 'channel_s':
+            media.channels = add(key, 'Канал(-ы)', str(value))
+
+        elif key == 'channel_positions':
+            media.channel_positions = add(key, 'Расположение каналов', str(value))
+
+        elif key == 'compression_mode':
+            if str(value) in ('Lossy', 'Lossless'):
+                text = add(key, 'Метод сжатия', 'С потерями' if str(value) == 'Lossy' else 'Без потерь')
+                if str(value) == 'Lossy':
+                    media.compression = text
+                if track_type == 'Video':
+                    media.compression_video = text
+                if track_type == 'Audio':
+                    media.compression_audio = text
+            else:
+                media.compression = add(key, 'Метод сжатия', str(value))
+
+        elif key == 'color_space':
+            media.color_space = add(key, 'Цветовое пространство', str(value))
+
+        elif key == 'other_bit_depth':
+            media.bit_depth = add(key, 'Битовая глубина', str(value[0]))
+
+        elif key == 'colour_primaries':
+            add(key, 'Основные цвета', str(value[0]))
+
+        elif key == 'file_extension':
+            media.extension = str(value)
+
+        elif key not in ('other_duration', 'frame_rate', 'other_language', 'encoded_date', 'format', 'format_info'):
+            add(key, None, str(value))
+
+    return MediaTrack(track_type, tuple(items))
@@ -0,0 +1,340 @@
+# Сериализация записей метаданных (records.py)
+#
+# XML-описание, файл контрольных сумм, файл для ручного заполнения КАМИС
+# и запись каталога (catalog.py) формируются из записи файла.
+
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict
+from checksum import generate_data_checksums
+from format_id import format_label
+from records import FileRecord, ImageRecord, VideoRecord, AudioRecord, PdfRecord, DocumentRecord
+
+ROOT_XML = 'GMIG'
+
+# Поля сведений о камере (RAW) -> подписи
+CAMERA_FIELDS = {
+    'make': 'Производитель камеры',
+    'model': 'Модель камеры',
+    'lens_model': 'Объектив',
+    'iso': 'ISO',
+    'exposure_time': 'Выдержка',
+    'f_number': 'Диафрагма',
+    'focal_length': 'Фокусное расстояние',
+    'date_original': 'Дата съемки',
+}
+
+
+# XML
+
+def to_xml(record: FileRecord) -> str:
+    """XML-описание файла."""
+    root = ET.Element(ROOT_XML)
+    file_info = ET.SubElement(root, 'File', name=record.name)
+    base_info = ET.SubElement(file_info, 'Сommon', name="Общие свойства")
+
+    ET.SubElement(base_info, 'fileName', name="Имя файла мастер-копии").text = record.name + os.path.splitext(record.file_path)[1]
+    ET.SubElement(base_info, 'file_extension', name="Формат").text = record.extension
+
+    format_id = ET.SubElement(base_info, 'format_id', name="Формат по сигнатуре")
+    format_id.text = record.file_format.name if record.file_format else format_label(None)
+    if record.file_format:
+        format_id.set('mime', record.file_format.mime)
+        if record.file_format.puid:
+            format_id.set('puid', record.file_format.puid)
+
+    ET.SubElement(base_info, 'date', name="Дата последнего изменения").text = record.modified
+    ET.SubElement(base_info, 'size', name="Размер").text = record.size_text
+    ET.SubElement(base_info, 'topography', name="Топография").text = record.topography
+
+    checksum = ET.SubElement(base_info, 'Checksum', name="Контрольная сумма")
+    ET.SubElement(checksum, 'hash', type=record.hash_algo_gost).text = record.checksum_gost
+    ET.SubElement(checksum, 'hash', type=record.hash_algo).text = record.checksum
+
+    if isinstance(record, VideoRecord):
+        _media_xml(file_info, record)
+    elif isinstance(record, ImageRecord):
+        _image_xml(file_info, record)
+    elif isinstance(record, PdfRecord):
+        _pdf_xml(file_info, record)
+    elif isinstance(record, DocumentRecord):
+        _document_xml(file_info, record)
+
+    # Преобразование XML в форматированный текст
+    ET.indent(root, space="    ")
+    return ET.tostring(root, encoding='unicode', method='xml', xml_declaration=True)
+
+
+def _sub(parent: ET.Element, tag: str, label: str, text: str) -> ET.Element:
+    element = ET.SubElement(parent, tag, name=label)
+    element.text = text
+    return element
+
+
+def _media_xml(file_info: ET.Element, record: VideoRecord):
+    media_tracks = ET.SubElement(file_info, 'Extended', name="Расширенные свойства")
+    for track in record.tracks:
+        track_element = ET.SubElement(media_tracks, 'Ext', type=track.track_type)
+        for tag, label, text in track.fields:
+            element = ET.SubElement(track_element, tag, name=label) if label else ET.SubElement(track_element, tag)
+            element.text = text
+
+
+def _image_xml(file_info: ET.Element, record: ImageRecord):
+    media_tracks = ET.SubElement(file_info, 'Extended', name="Расширенные свойства")
+    track_element = ET.SubElement(media_tracks, 'Ext', type="Image")
+
+    if record.image_format:
+        _sub(track_element, 'format', 'Формат', record.image_format)
+    if record.color_mode:
+        _sub(track_element, 'color_space', 'Цветовое пространство', record.color_mode)
+    if record.bit_depth:
+        _sub(track_element, 'bit_depth', 'Битовая глубина', record.bit_depth)
+    if record.width:
+        _sub(track_element, 'width', 'Ширина', str(record.width))
+    if record.height:
+        _sub(track_element, 'height', 'Высота', str(record.height))
+    if record.dpi:
+        _sub(track_element, 'density', 'Точек на дюйм', record.dpi)
+    if record.print_size_cm:
+        _sub(track_element, 'print_size_cm', 'Размер при печати (см)', record.print_size_cm)
+    if record.compression:
+        _sub(track_element, 'compression_mode', 'Метод сжатия', record.compression)
+    if record.page_count:
+        _sub(track_element, 'page_count', 'Количество страниц', str(record.page_count))
+    if record.pages:
+        pages_element = ET.SubElement(track_element, 'pages', name='Страницы (IFD)')
+        if record.truncated:
+            pages_element.set('truncated', 'true')
+        for index, width, height, compression, bit_depth, reduced, levels in record.pages:
+            page_element = ET.SubElement(pages_element, 'page', index=str(index), width=str(width), height=str(height),
+                                         compression=compression, bit_depth=bit_depth)
+            if reduced:
+                page_element.set('reduced', 'true')
+            for level_width, level_height in levels:
+                ET.SubElement(page_element, 'level', width=str(level_width), height=str(level_height))
+    if record.camera:
+        camera_element = ET.SubElement(track_element, 'camera', name='Камера')
+        for key, value in record.camera:
+            _sub(camera_element, key, CAMERA_FIELDS.get(key, key), value)
+    if record.tiff_metadata:
+        tiff_meta_element = ET.SubElement(track_element, 'tiff_metadata', name='tiff метаданные')
+        if isinstance(record.tiff_metadata, dict):
+            for key, value in record.tiff_metadata.items():
+                tag_element = ET.SubElement(tiff_meta_element, 'tag', name=key)
+                tag_element.text = str(value)
+        else:
+            tiff_meta_element.text = str(record.tiff_metadata)
+
+
+def _pdf_xml(file_info: ET.Element, record: PdfRecord):
+    media_tracks = ET.SubElement(file_info, 'Extended', name="Расширенные свойства")
+    track_element = ET.SubElement(media_tracks, 'Ext', type="Document")
+    _sub(track_element, 'totalPages', 'Количество страниц', str(record.total_pages))
+
+
+def _document_xml(file_info: ET.Element, record: DocumentRecord):
+    media_tracks = ET.SubElement(file_info, 'Extended', name="Расширенные свойства")
+    track_element = ET.SubElement(media_tracks, 'Ext', type="Document")
+    if record.encoding:
+        _sub(track_element, 'encoding', 'Кодировка текста', record.encoding)
+    if record.word_count:
+        _sub(track_element, 'word_count', 'Количество слов', str(record.word_count))
+    if record.char_count:
+        _sub(track_element, 'char_count', 'Количество букв', str(record.char_count))
+
+
+# Файл контрольных сумм
+
+def to_checksum_txt(record: FileRecord, xml_data: bytes) -> str:
+    """Контрольные суммы файла и его XML-описания (суммы XML считаются по данным в памяти)."""
+    xml_digests = generate_data_checksums(xml_data, [record.hash_algo_gost, record.hash_algo])
+    f = io.StringIO()
+    f.write(os.path.basename(record.file_path) + '\n')
+    f.write('Контрольная сумма:' + '\n')
+    f.write(record.hash_algo_gost + ': ' + record.checksum_gost + '\n')
+    f.write(record.hash_algo + ': ' + record.checksum + '\n')
+    f.write('\n')
+    f.write(os.path.basename(record.save_path) + '\n')
+    f.write('Контрольная сумма:' + '\n')
+    f.write(record.hash_algo_gost + ': ' + xml_digests[record.hash_algo_gost] + '\n')
+    f.write(record.hash_algo + ': ' + xml_digests[record.hash_algo])
+    return f.getvalue()
+
+
+# Файл для КАМИС
+
+def to_kamis_txt(record: FileRecord) -> str:
+    """Файл txt для ручного заполнения КАМИС."""
+    f = io.StringIO()
+    f.write('Имя файла мастер-копии: ' + record.name + os.path.splitext(record.file_path)[1] + '\n')
+    f.write('Формат: ' + record.extension + '\n')
+    f.write('Формат по сигнатуре: ' + format_label(record.file_format) + '\n')
+    f.write('Размер: ' + record.size_text + '\n')
+    f.write('Дата: ' + record.modified + '\n')
+    f.write('Топография: ' + record.topography + '\n')
+    f.write('Контрольная сумма ' + record.hash_algo_gost + ': ' + record.checksum_gost + '\n')
+    f.write('Контрольная сумма ' + record.hash_algo + ': ' + record.checksum + '\n\n')
+    if isinstance(record, AudioRecord):
+        _kamis_audio(f, record)
+    elif isinstance(record, VideoRecord):
+        _kamis_video(f, record)
+    elif isinstance(record, ImageRecord):
+        _kamis_image(f, record)
+    elif isinstance(record, PdfRecord):
+        _kamis_pdf(f, record)
+    elif isinstance(record, DocumentRecord):
+        _kamis_document(f, record)
+    return f.getvalue()
+
+
+def _kamis_audio_tracks(f, record: VideoRecord):
+    if record.format_audio:
+        f.write(f'Формат: {record.format_audio}\n')
+    if record.format_info_audio:
+        f.write(f'Формат/Информация: {record.format_info_audio}\n')
+    if record.bitrate_audio:
+        f.write(f'Битрейт: {record.bitrate_audio}\n')
+    if record.channels:
+        f.write(f'Канал(-ы): {record.channels}\n')
+    if record.channel_positions:
+        f.write(f'Расположение каналов: {record.channel_positions}\n')
+    if record.sampling_rate:
+        f.write(f'Частота дискретизации: {record.sampling_rate}\n')
+    if record.compression_audio:
+        f.write(f'Метод сжатия: {record.compression_audio}\n')
+
+
+def _kamis_video(f, record: VideoRecord):
+    f.write('## Расширенные свойства ##\n')
+    f.write('_General\n')
+    f.write(f'Формат: {record.format_general}\n')
+    if record.duration:
+        f.write(f'Продолжительность: {record.duration}\n')
+    if record.fps:
+        f.write(f'Частота кадров (FPS): {record.fps}\n\n')
+
+    f.write('_Video\n')
+    if record.format_video:
+        f.write(f'Формат: {record.format_video}\n')
+    if record.format_info_video:
+        f.write(f'Формат/Информация: {record.format_info_video}\n')
+    if record.encoded_date:
+        f.write(f'Дата кодирования: {record.encoded_date}\n')
+    if record.bitrate_video:
+        f.write(f'Битрейт: {record.bitrate_video}\n')
+    if record.width and record.height:
+        f.write(f'Разрешение: {record.width} x {record.height}\n\n')
+
+    f.write('_Audio\n')
+    _kamis_audio_tracks(f, record)
+
+
+def _kamis_audio(f, record: AudioRecord):
+    f.write('## Расширенные свойства ##\n')
+    f.write('_General\n')
+    f.write(f'Формат: {record.format_general}\n')
+    if record.duration:
+        f.write(f'Продолжительность: {record.duration}\n')
+
+    f.write('_Audio\n')
+    _kamis_audio_tracks(f, record)
+
+
+def _kamis_image(f, record: ImageRecord):
+    f.write('## Расширенные свойства ##\n')
+    f.write('_General\n')
+    f.write(f'Формат: {record.image_format}\n\n')
+    f.write('_Image\n')
+    if record.width:
+        f.write(f'Разрешение: {record.width} x {record.height}\n')
+    if record.dpi:
+        f.write(f'Точек на дюйм: {record.dpi}\n')
+    if record.print_size_cm:
+        f.write(f'Размер при печати (см): {record.print_size_cm}\n')
+    if record.color_mode:
+        f.write(f'Цветовое пространство: {record.color_mode}\n')
+    if record.bit_depth:
+        f.write(f'Глубина цвета (обычно на канал): {record.bit_depth}\n')
+    if record.compression:
+        f.write(f'Метод сжатия: {record.compression}\n')
+    if record.page_count:
+        f.write(f'Количество страниц: {record.page_count}\n')
+    for key, value in record.camera:
+        f.write(f'{CAMERA_FIELDS.get(key, key)}: {value}\n')
+
+
+def _kamis_pdf(f, record: PdfRecord):
+    f.write('## Расширенные свойства ##\n')
+    f.write('_General\n')
+    f.write(f'Формат: {record.kind}\n\n')                     # Формат не определяется автоматически!
+    f.write('_Document\n')
+    f.write(f'Количество страниц: {record.total_pages}\n')
+
+
+def _kamis_document(f, record: DocumentRecord):
+    f.write('## Расширенные свойства ##\n')
+    f.write('_General\n')
+    f.write(f'Формат: {record.kind}\n\n')                     # Формат не определяется автоматически!
+    f.write('_Document\n')
+    if record.encoding:
+        f.write(f'Кодировка текста: {record.encoding}\n')
+    if record.word_count:
+        f.write(f'Количество слов: {record.word_count}\n')
+    if record.char_count:
+        f.write(f'Количество букв: {record.char_count}\n')
+
+
+# Каталог
+
+def _leading_number(value, cast):
+    """Число в начале строки ("300 x 300" -> 300) или None."""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', str(value)) if value is not None else None
+    return cast(float(match.group(1))) if match else None
+
+
+def to_catalog(record: FileRecord, mtime: float) -> Dict[str, Any]:
+    """Запись для каталога метаданных (catalog.py)."""
+    ext = os.path.splitext(record.file_path)[1]
+    row = {
+        'path': os.path.abspath(record.file_path),
+        'name': record.name + ext,
+        'ext': ext.lower(),
+        'size': record.size,
+        'mtime': mtime,
+        'type': record.kind,
+        'format_name': record.file_format.name if record.file_format else None,
+        'mime': record.file_format.mime if record.file_format else None,
+        'puid': record.file_format.puid if record.file_format else None,
+        'sha1': record.checksum,
+        'gost': record.checksum_gost,
+        'topography': record.topography,
+        'sidecar': os.path.abspath(record.save_path),
+    }
+    if isinstance(record, (ImageRecord, VideoRecord)):
+        row.update(width=_leading_number(record.width, int), height=_leading_number(record.height, int),
+                   bit_depth=_leading_number(record.bit_depth, int))
+    if isinstance(record, ImageRecord):
+        row.update(dpi=_leading_number(record.dpi, float), compression=record.compression,
+                   page_count=record.page_count)
+    elif isinstance(record, VideoRecord):
+        # Сжатие основной дорожки: звука для аудиофайла, изображения для видео
+        compression = record.compression_audio if isinstance(record, AudioRecord) else record.compression_video
+        row.update(duration=record.duration, compression=compression)
+    elif isinstance(record, PdfRecord):
+        row.update(page_count=record.total_pages)
+    elif isinstance(record, DocumentRecord):
+        row.update(word_count=record.word_count, char_count=record.char_count, encoding=record.encoding)
+    # Простые значения записи (без дорожек и страниц) - в поле metadata
+    row['metadata'] = {name: getattr(record, name) for name in _slot_names(type(record))
+                       if isinstance(getattr(record, name), (str, int, float))}
+    return row
+
+
+def _slot_names(record_class) -> tuple:
+    names = []
+    for cls in reversed(record_class.__mro__):
+        names.extend(getattr(cls, '__slots__', ()))
+    return tuple(names)
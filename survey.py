@@ -0,0 +1,369 @@
+# Предварительный обзор поступления (без полного хеширования)
+#
+# Перед многодневной обработкой большого поступления нужна быстрая оценка его
+# содержимого. Дерево папок обходится один раз: для каждого файла читается
+# только заголовок (формат по сигнатуре, format_id.py). Разбор (ImageMagick,
+# MediaInfo, PDF, документы) выполняется для случайной выборки файлов каждого
+# типа (reservoir sampling, выборка равномерна при одном проходе). Скорость
+# чтения измеряется до разбора на отдельной выборке файлов, страницы которых
+# предварительно удаляются из кэша (иначе измеряется скорость кэша), скорость
+# хеширования - на данных в памяти; по ним оценивается время полного хеширования.
+#
+# В отчете: распределение по форматам, общий объем, оценка времени хеширования
+# и разбора, подозрительные файлы (пустые, нечитаемые, расширение не
+# соответствует содержимому, неизвестный формат, ошибка разбора).
+#
+# Пример:
+#   python survey.py /mnt/share/delivery --sample 50 --report survey.json
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional
+from checksum import generate_data_checksums
+from file_types import UNKNOWN_TYPE, detect_file_type
+from format_id import identify_format, read_header, format_label
+from io_tuning import get_tuner, fadvise
+from media_info import get_image_info, get_media_tracks, get_pdf_page_count, get_text_file_meta
+from output_writer import write_atomic, start_queue_logging
+from probe_pool import ProbePool, ProbeError, run_probe
+from utils import SKIP_EXT, convert_bytes
+
+# Файлов каждого типа в выборке для разбора
+SAMPLE_PER_TYPE = 25
+# Потоков чтения заголовков (на сетевых ресурсах задержка важнее пропускной способности)
+SNIFF_WORKERS = 8
+SNIFF_BATCH = 256
+# Объем чтения для замера скорости: всего и с одного файла; файлов в выборке для замера
+READ_SAMPLE_FILES = 32
+THROUGHPUT_BYTES = 256 * 1024 * 1024  # 256MB
+THROUGHPUT_FILE_BYTES = 64 * 1024 * 1024  # 64MB
+# Объем данных для замера скорости хеширования
+HASH_TEST_BYTES = 16 * 1024 * 1024  # 16MB
+HASH_ALGOS = ('GR3411_2012_256', 'SHA1')
+# Модель оценки времени хеширования (выводится в отчете)
+PROJECTION_MODEL = ("один поток: чтение и хеширование блока последовательно; параллельное чтение "
+                    "больших файлов (PARALLEL_READERS) и несколько потоков хеширования конвейера не учитываются - "
+                    "на быстрых хранилищах фактическое время может быть меньше")
+# Подозрительных файлов в отчете не больше (счетчики по причинам - полные)
+MAX_SUSPICIOUS = 1000
+
+
+def _probe_image(file_path: str, file_format=None):
+    return get_image_info(file_path)
+
+
+def _probe_media(file_path: str, file_format=None):
+    return get_media_tracks(file_path)
+
+
+def _probe_pdf(file_path: str, file_format=None):
+    return get_pdf_page_count(file_path)
+
+
+# Функции разбора по типу файла (выполняются в пуле процессов - только функции модуля)
+_PROBES = {
+    "photos": _probe_image,
+    "video": _probe_media,
+    "audio": _probe_media,
+    "pdf": _probe_pdf,
+    "documents": get_text_file_meta,
+}
+
+
+class _Reservoir:
+    """Равномерная случайная выборка фиксированного размера за один проход."""
+    def __init__(self, size: int, rng: random.Random):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.items: List[Dict[str, Any]] = []
+
+    def add(self, item: Dict[str, Any]) -> None:
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            index = self.rng.randrange(self.seen)
+            if index < self.size:
+                self.items[index] = item
+
+
+def _iter_files(source_root: str) -> Iterator[str]:
+    for roots, _, files in os.walk(source_root):
+        for file in files:
+            if file.startswith('.') or file.endswith(SKIP_EXT):
+                continue
+            yield os.path.join(roots, file)
+
+
+def sniff_file(file_path: str) -> Dict[str, Any]:
+    """Размер, формат по сигнатуре и тип файла; issue - причина, по которой файл подозрителен."""
+    extension = os.path.splitext(file_path)[1]
+    by_extension = detect_file_type(extension)
+    entry = {'path': file_path, 'ext': extension.lower(), 'size': 0, 'format': None, 'category': by_extension,
+             'issue': None, 'detail': None}
+    try:
+        entry['size'] = os.path.getsize(file_path)
+    except OSError as e:
+        entry.update(issue='unreadable', detail=str(e))
+        return entry
+    if entry['size'] == 0:
+        entry['issue'] = 'empty'
+        return entry
+    header = read_header(file_path)
+    if not header:
+        entry['issue'] = 'unreadable'
+        return entry
+
+    file_format = identify_format(header, extension)
+    entry['format'] = file_format
+    if file_format is not None and file_format.category is not None:
+        entry['category'] = file_format.category
+        if by_extension != UNKNOWN_TYPE and by_extension != file_format.category:
+            entry.update(issue='mismatch', detail=f"{by_extension} -> {file_format.name}")
+    elif by_extension == UNKNOWN_TYPE:
+        entry['issue'] = 'unsupported'
+    return entry
+
+
+def _probe(pool: Optional[ProbePool], entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Разбор файла выборки: время и ошибка (если есть)."""
+    started = time.perf_counter()
+    try:
+        result = run_probe(pool, _PROBES[entry['category']], entry['path'], entry['format'])
+    except ProbeError as e:
+        return {'seconds': time.perf_counter() - started, 'error': str(e)}
+    except Exception as e:
+        return {'seconds': time.perf_counter() - started, 'error': f"{type(e).__name__}: {e}"}
+    error = None
+    if isinstance(result, dict) and result.get('Error'):
+        # Разбор без пула процессов: ошибка возвращается значением
+        error = result['Error']
+    elif entry['category'] in ("video", "audio") and not any(t.get('track_type') in ('Video', 'Audio') for t in result):
+        error = "Нет видео- и аудиодорожек"
+    elif entry['category'] == "photos" and result.get('truncated'):
+        error = "Файл обрезан"
+    elif entry['category'] == "pdf" and not result:
+        error = "Нет страниц"
+    return {'seconds': time.perf_counter() - started, 'error': error}
+
+
+def measure_read_speed(entries: List[Dict[str, Any]], budget: int = THROUGHPUT_BYTES,
+                       file_limit: int = THROUGHPUT_FILE_BYTES) -> Dict[str, Any]:
+    """Скорость чтения по файлам выборки.
+
+    Перед замером страницы файла удаляются из кэша (POSIX_FADV_DONTNEED): файл мог быть прочитан
+    раньше. Без posix_fadvise (Windows, macOS) замер может быть завышен кэшем.
+    """
+    tuner = get_tuner()
+    total, seconds, files = 0, 0.0, 0
+    for entry in entries:
+        if total >= budget:
+            break
+        limit = min(entry['size'], file_limit, budget - total)
+        if limit <= 0:
+            continue
+        block_size = tuner.block_size(entry['path'], entry['size'])
+        try:
+            with open(entry['path'], 'rb', buffering=0) as f:
+                fadvise(f.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
+                started = time.perf_counter()
+                fadvise(f.fileno(), 0, 0, 'POSIX_FADV_SEQUENTIAL')
+                done = 0
+                while done < limit:
+                    chunk = f.read(min(block_size, limit - done))
+                    if not chunk:
+                        break
+                    done += len(chunk)
+                # Прочитанные при замере страницы не нужны в кэше
+                fadvise(f.fileno(), 0, done, 'POSIX_FADV_DONTNEED')
+        except OSError as e:
+            logging.warning(f"Не удалось прочитать {entry['path']}: {e}")
+            continue
+        seconds += time.perf_counter() - started
+        total += done
+        files += 1
+    return {'files': files, 'bytes': total, 'seconds': seconds, 'speed': total / seconds if seconds > 0 else None}
+
+
+def measure_hash_speed(size: int = HASH_TEST_BYTES) -> Dict[str, Any]:
+    """Скорость хеширования (все алгоритмы за один проход) на данных в памяти."""
+    data = os.urandom(size)
+    started = time.perf_counter()
+    digests = generate_data_checksums(data, HASH_ALGOS)
+    seconds = time.perf_counter() - started
+    available = [algo for algo in HASH_ALGOS if not digests[algo].startswith('*')]
+    return {'algos': available, 'speed': size / seconds if seconds > 0 and available else None}
+
+
+def survey(source_root: str, sample_per_type: int = SAMPLE_PER_TYPE, probe: bool = True,
+           isolate_probes: bool = True, probe_workers: Optional[int] = None, throughput_bytes: int = THROUGHPUT_BYTES,
+           seed: Optional[int] = None, sniff_workers: int = SNIFF_WORKERS) -> Dict[str, Any]:
+    """Обзор поступления: формат каждого файла по заголовку, разбор и замеры скорости по выборке."""
+    rng = random.Random(seed)
+    started = time.monotonic()
+    formats: Dict[tuple, Dict[str, Any]] = {}
+    categories: Dict[str, Dict[str, Any]] = {}
+    samples: Dict[str, _Reservoir] = {}
+    # Отдельная выборка для замера скорости чтения (не совпадает с разбираемыми файлами по кэшу)
+    read_samples = _Reservoir(READ_SAMPLE_FILES, rng)
+    issues: Dict[str, int] = {}
+    suspicious: List[Dict[str, Any]] = []
+    files, total_bytes = 0, 0
+
+    def flag(entry: Dict[str, Any], issue: str, detail: Optional[str] = None):
+        issues[issue] = issues.get(issue, 0) + 1
+        if len(suspicious) < MAX_SUSPICIOUS:
+            suspicious.append({'path': entry['path'], 'issue': issue, 'detail': detail})
+
+    paths = _iter_files(source_root)
+    with ThreadPoolExecutor(max_workers=sniff_workers) as executor:
+        while True:
+            batch = list(islice(paths, SNIFF_BATCH))
+            if not batch:
+                break
+            for entry in executor.map(sniff_file, batch):
+                files += 1
+                total_bytes += entry['size']
+                file_format = entry['format']
+                key = (format_label(file_format) if file_format else f"Не определено ({entry['ext'] or 'без расширения'})",
+                       file_format.mime if file_format else None)
+                stats = formats.setdefault(key, {'format': key[0], 'mime': key[1], 'category': entry['category'],
+                                                 'files': 0, 'bytes': 0})
+                stats['files'] += 1
+                stats['bytes'] += entry['size']
+                category = categories.setdefault(entry['category'], {'files': 0, 'bytes': 0})
+                category['files'] += 1
+                category['bytes'] += entry['size']
+                if entry['issue']:
+                    flag(entry, entry['issue'], entry['detail'])
+                if entry['issue'] not in ('empty', 'unreadable'):
+                    samples.setdefault(entry['category'], _Reservoir(sample_per_type, rng)).add(entry)
+                    read_samples.add(entry)
+    walk_seconds = time.monotonic() - started
+    logging.info(f"Обход {source_root}: {files} файлов, {convert_bytes(total_bytes)} за {walk_seconds:.1f} с")
+
+    # Замер скорости чтения - до разбора: разбор загружает файлы выборки в кэш
+    read = measure_read_speed(read_samples.items, throughput_bytes)
+    hashing = measure_hash_speed()
+    projected = None
+    if read['speed'] and hashing['speed']:
+        # Чтение и хеширование блока выполняются последовательно (см. PROJECTION_MODEL)
+        projected = total_bytes / read['speed'] + total_bytes / hashing['speed']
+
+    # Разбор выборки
+    if probe:
+        to_probe = [entry for file_type, reservoir in samples.items() if file_type in _PROBES
+                    for entry in reservoir.items]
+        workers = probe_workers or max((os.cpu_count() or 2) // 2, 1)
+        pool = ProbePool(workers) if isolate_probes and to_probe else None
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda entry: _probe(pool, entry), to_probe))
+        finally:
+            if pool is not None:
+                pool.close()
+        for entry, result in zip(to_probe, results):
+            category = categories[entry['category']]
+            category['sampled'] = category.get('sampled', 0) + 1
+            category['probe_seconds'] = category.get('probe_seconds', 0.0) + result['seconds']
+            if result['error']:
+                category['probe_errors'] = category.get('probe_errors', 0) + 1
+                flag(entry, 'probe_error', result['error'])
+        for category in categories.values():
+            if category.get('sampled'):
+                category['probe_seconds_mean'] = category['probe_seconds'] / category['sampled']
+                category['probe_error_rate'] = category.get('probe_errors', 0) / category['sampled']
+                category['projected_probe_seconds'] = category['probe_seconds_mean'] * category['files']
+
+    return {
+        'root': os.path.abspath(source_root),
+        'files': files,
+        'bytes': total_bytes,
+        'walk_seconds': walk_seconds,
+        'formats': sorted(formats.values(), key=lambda stats: stats['bytes'], reverse=True),
+        'categories': categories,
+        'throughput': {'read': read, 'hash': hashing, 'projected_hash_seconds': projected,
+                       'projection_model': PROJECTION_MODEL},
+        'issues': issues,
+        'suspicious': suspicious,
+        'created': time.time(),
+    }
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "нет данных"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days} д {hours} ч {minutes} мин"
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    return f"{minutes} мин {seconds} с"
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Папка: {report['root']}")
+    print(f"Файлов: {report['files']}, объем: {convert_bytes(report['bytes'])}")
+    print("\nФорматы:")
+    for stats in report['formats']:
+        print(f"  {stats['format']}\t{stats['files']}\t{convert_bytes(stats['bytes'])}")
+    print("\nТипы файлов:")
+    for name, category in sorted(report['categories'].items()):
+        line = f"  {name}\t{category['files']}\t{convert_bytes(category['bytes'])}"
+        if category.get('sampled'):
+            line += (f"\tвыборка {category['sampled']}, ошибок {category.get('probe_errors', 0)}, "
+                     f"разбор ~{_format_seconds(category['projected_probe_seconds'])}")
+        print(line)
+    throughput = report['throughput']
+    read, hashing = throughput['read'], throughput['hash']
+    print()
+    if read['speed']:
+        print(f"Скорость чтения: {convert_bytes(read['speed'])}/с ({read['files']} файлов)")
+    if hashing['speed']:
+        print(f"Скорость хеширования ({', '.join(hashing['algos'])}): {convert_bytes(hashing['speed'])}/с")
+    print(f"Оценка времени хеширования: {_format_seconds(throughput['projected_hash_seconds'])}")
+    print(f"  ({throughput['projection_model']})")
+    if report['issues']:
+        print("\nПодозрительные файлы: " + ', '.join(f"{issue} {count}" for issue, count in report['issues'].items()))
+        for item in report['suspicious']:
+            print(f"  {item['issue']}\t{item['path']}" + (f"\t{item['detail']}" if item['detail'] else ''))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Предварительный обзор поступления без полного хеширования")
+    parser.add_argument('folder', help="Папка поступления")
+    parser.add_argument('--sample', type=int, default=SAMPLE_PER_TYPE, help="Файлов каждого типа для разбора")
+    parser.add_argument('--no-probe', action='store_true', help="Без разбора выборки")
+    parser.add_argument('--no-isolate', action='store_true', help="Разбор в текущем процессе")
+    parser.add_argument('--throughput-mb', type=int, default=THROUGHPUT_BYTES // (1024 * 1024),
+                        help="Объем чтения для замера скорости, MB")
+    parser.add_argument('--seed', type=int, help="Начальное значение генератора выборки")
+    parser.add_argument('--report', help="Сохранить отчет в JSON")
+    parser.add_argument('--json', action='store_true', help="Вывод в формате JSON")
+    args = parser.parse_args(argv)
+
+    start_queue_logging(handlers=[logging.StreamHandler()])
+    report = survey(args.folder, args.sample, probe=not args.no_probe, isolate_probes=not args.no_isolate,
+                    throughput_bytes=args.throughput_mb * 1024 * 1024, seed=args.seed)
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        write_atomic(args.report, data.encode('utf-8'))
+    if args.json:
+        print(data)
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
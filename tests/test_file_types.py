@@ -0,0 +1,23 @@
+# Реестр типов файлов
+
+from file_types import FILE_TYPES, register_file_type, detect_file_type, get_handler, get_handler_class
+from xml_generator import ImageHandler
+
+
+def _handler(file_path, save_path, topo):
+    pass
+
+
+def test_reregister_keeps_handler_class():
+    register_file_type("test_images", [".tst1"], _handler, ImageHandler)
+    register_file_type("test_images", [".tst2"], _handler)
+    assert get_handler_class("test_images") is ImageHandler
+    assert get_handler("test_images") is _handler
+
+
+def test_extension_moves_to_new_type():
+    register_file_type("test_old", [".tst3", ".tst4"], _handler)
+    register_file_type("test_new", [".tst3"], _handler)
+    assert detect_file_type(".tst3") == "test_new"
+    assert FILE_TYPES["test_old"]["extensions"] == [".tst4"]
+    assert FILE_TYPES["test_new"]["extensions"] == [".tst3"]
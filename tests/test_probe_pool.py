@@ -0,0 +1,19 @@
+# Изолированный разбор: ошибки разбора доходят до вызывающего кода
+
+import pytest
+from probe_pool import ProbePool, ProbeError
+
+pytest.importorskip('wand.image')
+from media_info import get_image_info
+
+
+def test_wand_error_is_probe_error(tmp_path):
+    # Файл с расширением JPEG, который ImageMagick не может декодировать
+    path = tmp_path / 'broken.jpg'
+    path.write_bytes(b'\xff\xd8\xff\xe0' + b'\x00' * 64)
+    with ProbePool(1) as pool:
+        with pytest.raises(ProbeError, match='Не удалось обработать файл'):
+            pool.call(get_image_info, str(path))
+        # Процесс остается рабочим после ошибки
+        with pytest.raises(ProbeError):
+            pool.call(get_image_info, str(path))
@@ -0,0 +1,22 @@
+# Создание записей по результатам функций разбора
+
+import pytest
+from records import image_record, document_record, ImageRecord
+from test_serializers import IMAGE_INFO, _base
+
+
+def test_image_record_from_info():
+    record = image_record(_base('scan.tif'), IMAGE_INFO)
+    assert isinstance(record, ImageRecord)
+    assert (record.width, record.height) == (6000, 4000)
+
+
+def test_image_error_fails_file():
+    # get_image_info возвращает ошибку Wand значением: файл не должен считаться обработанным
+    with pytest.raises(ValueError, match='Не удалось обработать файл'):
+        image_record(_base('scan.tif'), {'Error': 'Не удалось обработать файл: corrupt image'})
+
+
+def test_document_error_fails_file():
+    with pytest.raises(ValueError, match='Неподдерживаемый тип файла'):
+        document_record(_base('notes.rtf'), {'Error': 'Неподдерживаемый тип файла: .rtf'})
@@ -0,0 +1,148 @@
+# Сравнение выходных файлов с эталонами
+#
+# Эталоны в tests/golden сформированы кодом xml_generator.py до перехода на
+# записи (records.py) и сериализаторы (serializers.py) для тех же входных
+# данных: дорожек MediaInfo, результата get_image_info, числа страниц PDF и
+# статистики документа. Тест собирает записи из этих данных и сравнивает
+# XML, файл контрольных сумм и файл для КАМИС с эталонами.
+#
+# Отличие от старого кода одно: в файле для КАМИС имя видео- и аудиофайла
+# содержит настоящее расширение (старый код подставлял расширение MediaInfo
+# без точки: "filmmp4").
+
+import os
+import pytest
+from format_id import FileFormat
+from records import (FileRecord, AudioRecord, VideoRecord, image_record, media_record, pdf_record,
+                     document_record)
+from serializers import to_xml, to_checksum_txt, to_kamis_txt, to_catalog
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+TOPO = "Цифровой репозиторий - Музей истории ГУЛАГа"
+MODIFIED = "2023-11-14 22:13:20 UTC"
+CHECKSUM = "A" * 40
+CHECKSUM_GOST = "0123456789ABCDEF" * 4
+
+VIDEO_TRACKS = [
+    {'track_type': 'General', 'format': 'MPEG-4', 'file_extension': 'mp4',
+     'other_duration': ['1 h 2 min', '1 h 2 min 3 s', '1 h 2 min 3 s 40 ms', '01:02:03;01', '01:02:03.040'],
+     'frame_rate': '25.000', 'file_last_modification_date': 'UTC 2024-01-01 00:00:00', 'bit_rate': '5000000',
+     'unknown_key': 'skip'},
+    {'track_type': 'Video', 'format': 'AVC', 'format_info': 'Advanced Video Codec',
+     'format_url': 'http://developers.videolan.org/x264.html', 'bit_rate': '4500000', 'width': 1920, 'height': 1080,
+     'other_display_aspect_ratio': ['16:9'], 'scan_type': 'Progressive', 'encoded_date': 'UTC 2023-12-31 10:00:00',
+     'compression_mode': 'Lossy', 'color_space': 'YUV', 'other_bit_depth': ['8 bits'], 'colour_primaries': 'BT.709',
+     'frame_rate': '25', 'density': '72', 'other_bit_rate_mode': ['Variable'], 'other_maximum_bit_rate': ['6 Mb/s']},
+    {'track_type': 'Audio', 'format': 'AAC', 'format_info': 'Advanced Audio Codec', 'bit_rate': '192000',
+     'channel_s': 2, 'channel_positions': 'Front: L R', 'sampling_rate': 48000, 'compression_mode': 'Lossless',
+     'other_language': ['Russian'], 'other_bit_rate_mode': ['Constant']},
+]
+
+AUDIO_TRACKS = [
+    {'track_type': 'General', 'format': 'MPEG Audio', 'file_extension': 'mp3',
+     'other_duration': ['3 min 5 s', '3 min 5 s', '3 min 5 s 120 ms', '00:03:05;00', '00:03:05.120'],
+     'bit_rate': '320000'},
+    {'track_type': 'Audio', 'format': 'MPEG Audio', 'format_info': 'MPEG Audio', 'bit_rate': '320000',
+     'channel_s': 2, 'sampling_rate': 44100, 'compression_mode': 'Lossy', 'other_language': ['English']},
+]
+
+IMAGE_INFO = {
+    'format': 'TIFF', 'color_mode': 'sRGB', 'bit_depth': '8 bit', 'width_px': 6000, 'height_px': 4000,
+    'dpi': '300 x 300', 'print_size_cm': '50.80 x 33.87', 'compression': 'LZW (без потерь)', 'page_count': 2,
+    'pages': [
+        {'index': 0, 'width_px': 6000, 'height_px': 4000, 'compression': 'LZW', 'bit_depth': '8 bit',
+         'reduced': False, 'levels': [(3000, 2000), (1500, 1000)]},
+        {'index': 1, 'width_px': 600, 'height_px': 400, 'compression': 'None', 'bit_depth': '8 bit',
+         'reduced': True, 'levels': []},
+    ],
+    'truncated': False,
+    'camera': {'make': 'Canon', 'model': 'EOS 5D', 'exposure_time': '1/250 с', 'f_number': 'f/8.0'},
+    'tiff_metadata': {'tiff:software': 'Scanner 1.0', 'tiff:artist': 'Музей'},
+}
+
+DOCUMENT_DATA = {'encoding': 'utf-8', 'word_count': 1234, 'char_count': 6789}
+
+# name, размер (текст), формат по сигнатуре
+FILES = {
+    'film.mp4': ("1.21 KB (1 234 bytes)", FileFormat("MPEG-4", "video/mp4", None, "fmt/199")),
+    'song.mp3': ("2.41 KB (2 468 bytes)", FileFormat("MP3", "audio/mpeg", "audio", "fmt/134")),
+    'scan.tif': ("4.82 KB (4 936 bytes)", FileFormat("TIFF", "image/tiff", "photos", "fmt/353")),
+    'book.pdf': ("9.64 KB (9 872 bytes)", FileFormat("PDF 1.4", "application/pdf", "pdf", "fmt/18")),
+    'notes.rtf': ("1.00 KB (1 024 bytes)", FileFormat("Rich Text Format", "application/rtf", "documents")),
+    'data.bin': ("100.00 bytes (100 bytes)", None),
+}
+
+
+def _base(file_name: str) -> FileRecord:
+    size_text, file_format = FILES[file_name]
+    name, ext = os.path.splitext(file_name)
+    return FileRecord(
+        file_path=os.path.join('/master', file_name),
+        save_path=os.path.join('/master', name + '.xml'),
+        name=name,
+        extension=ext,
+        topography=TOPO,
+        size=int(size_text.split('(')[1].split(' bytes')[0].replace(' ', '')),
+        size_text=size_text,
+        modified=MODIFIED,
+        file_format=file_format,
+        checksum=CHECKSUM,
+        checksum_gost=CHECKSUM_GOST,
+    )
+
+
+def fixture_records():
+    return {
+        'film.mp4': media_record(_base('film.mp4'), VIDEO_TRACKS, VideoRecord),
+        'song.mp3': media_record(_base('song.mp3'), AUDIO_TRACKS, AudioRecord),
+        'scan.tif': image_record(_base('scan.tif'), IMAGE_INFO),
+        'book.pdf': pdf_record(_base('book.pdf'), 12),
+        'notes.rtf': document_record(_base('notes.rtf'), DOCUMENT_DATA),
+        'data.bin': _base('data.bin'),
+    }
+
+
+def _golden(file_name: str) -> str:
+    with open(os.path.join(GOLDEN, file_name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _golden_bytes(file_name: str) -> bytes:
+    with open(os.path.join(GOLDEN, file_name), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('file_name', sorted(FILES))
+def test_xml_matches_golden(file_name):
+    record = fixture_records()[file_name]
+    assert to_xml(record) == _golden(record.name + '.xml')
+
+
+@pytest.mark.parametrize('file_name', sorted(FILES))
+def test_checksum_txt_matches_golden(file_name):
+    record = fixture_records()[file_name]
+    xml_data = _golden_bytes(record.name + '.xml')
+    assert to_checksum_txt(record, xml_data) == _golden(record.name + '.txt')
+
+
+@pytest.mark.parametrize('file_name', sorted(FILES))
+def test_kamis_txt_matches_golden(file_name):
+    record = fixture_records()[file_name]
+    assert to_kamis_txt(record) == _golden(record.name + '_KAMIS.txt')
+
+
+def test_kamis_video_without_height():
+    # MediaInfo сообщает ширину без высоты (например, звук в видеоконтейнере)
+    tracks = [VIDEO_TRACKS[0], {'track_type': 'Video', 'format': 'AVC', 'width': 1920}]
+    record = media_record(_base('film.mp4'), tracks, VideoRecord)
+    text = to_kamis_txt(record)
+    assert 'Разрешение' not in text
+
+
+def test_catalog_compression_of_main_track():
+    records = fixture_records()
+    # Видео сжато с потерями, звуковая дорожка - без потерь
+    assert to_catalog(records['film.mp4'], 0)['compression'] == 'С потерями'
+    assert to_catalog(records['song.mp3'], 0)['compression'] == 'С потерями'
+    assert to_catalog(records['scan.tif'], 0)['compression'] == 'LZW (без потерь)'
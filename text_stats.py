@@ -0,0 +1,310 @@
+# Потоковый подсчет слов и символов в документах
+#
+# Текст не собирается целиком: XML-часть документа читается из ZIP-архива
+# блоками и разбирается expat (тот же парсер, что используется в iterparse),
+# символьные данные сразу передаются в счетчик. Память не зависит от размера
+# документа.
+
+import re
+import zipfile
+from xml.parsers import expat
+
+# Размер блока чтения XML из архива
+_CHUNK_SIZE = 64 * 1024
+
+_W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_TEXT_NS = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+
+class TextStats:
+    """Инкрементальный подсчет: результат совпадает с len(text.split()) и len(text)
+    для текста, переданного по частям."""
+    def __init__(self):
+        self.words = 0
+        self.chars = 0
+        self._in_word = False
+
+    def feed(self, text: str) -> None:
+        if not text:
+            return
+        self.chars += len(text)
+        words = len(text.split())
+        # Слово, разорванное между частями, считаем один раз
+        if words and self._in_word and not text[0].isspace():
+            words -= 1
+        self.words += words
+        self._in_word = not text[-1].isspace()
+
+
+class _ParagraphCounter:
+    """Общая часть для DOCX и ODT: абзацы разделяются переводом строки, как в "\\n".join(...)."""
+    def __init__(self):
+        self.stats = TextStats()
+        self.paragraphs = 0
+        self.in_paragraph = False
+
+    def start_paragraph(self) -> None:
+        if self.paragraphs:
+            self.stats.feed('\n')
+        self.paragraphs += 1
+        self.in_paragraph = True
+
+    def end_paragraph(self) -> None:
+        self.in_paragraph = False
+
+
+def _parse_zip_member(file_path: str, member: str, parser) -> None:
+    """Передает XML-член архива в парсер блоками."""
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open(member) as f:
+            while True:
+                chunk = f.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parser.Parse(chunk, False)
+    parser.Parse(b'', True)
+
+
+def count_docx_text(file_path: str) -> TextStats:
+    """Считает слова и символы в абзацах тела документа DOCX (word/document.xml)."""
+    counter = _ParagraphCounter()
+    depth = 0
+    body_depth = None
+    text_depth = 0     # внутри w:t
+    textbox_depth = 0  # текст во врезках python-docx не включает в абзац
+
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.buffer_text = True
+
+    def in_body_paragraph(name):
+        return name == _W_NS + 'p' and body_depth is not None and depth == body_depth + 1
+
+    def start(name, attrs):
+        nonlocal depth, body_depth, text_depth, textbox_depth
+        depth += 1
+        if name == _W_NS + 'body':
+            body_depth = depth
+        elif in_body_paragraph(name):
+            counter.start_paragraph()
+        elif name == _W_NS + 'txbxContent':
+            textbox_depth += 1
+        elif name == _W_NS + 't':
+            text_depth += 1
+        elif counter.in_paragraph and not textbox_depth:
+            if name == _W_NS + 'tab':
+                counter.stats.feed('\t')
+            elif name in (_W_NS + 'br', _W_NS + 'cr'):
+                counter.stats.feed('\n')
+
+    def end(name):
+        nonlocal depth, text_depth, textbox_depth
+        if in_body_paragraph(name):
+            counter.end_paragraph()
+        elif name == _W_NS + 'txbxContent':
+            textbox_depth -= 1
+        elif name == _W_NS + 't':
+            text_depth -= 1
+        depth -= 1
+
+    def data(text):
+        if text_depth and counter.in_paragraph and not textbox_depth:
+            counter.stats.feed(text)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    _parse_zip_member(file_path, 'word/document.xml', parser)
+    return counter.stats
+
+
+def count_odt_text(file_path: str) -> TextStats:
+    """Считает слова и символы в абзацах (text:p) документа ODT (content.xml)."""
+    counter = _ParagraphCounter()
+    paragraph_depth = 0  # вложенные абзацы (например, в сносках) считаются частью внешнего
+
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.buffer_text = True
+
+    def start(name, attrs):
+        nonlocal paragraph_depth
+        if name == _TEXT_NS + 'p':
+            if not paragraph_depth:
+                counter.start_paragraph()
+            paragraph_depth += 1
+
+    def end(name):
+        nonlocal paragraph_depth
+        if name == _TEXT_NS + 'p':
+            paragraph_depth -= 1
+            if not paragraph_depth:
+                counter.end_paragraph()
+
+    def data(text):
+        if paragraph_depth:
+            counter.stats.feed(text)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    _parse_zip_member(file_path, 'content.xml', parser)
+    return counter.stats
+
+
+# RTF
+#
+# Токенизатор работает с байтами и не декодирует пропускаемые группы:
+# шестнадцатеричные данные картинок (\pict) и двоичные блоки (\bin) только
+# пролистываются регулярным выражением. Список пропускаемых групп и замены
+# управляющих слов взяты из striprtf, чтобы результаты подсчета совпадали.
+
+_RTF_READ_SIZE = 1024 * 1024
+
+_RTF_TOKEN = re.compile(
+    rb"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?"  # 1, 2: управляющее слово и параметр
+    rb"|\\'([0-9a-fA-F]{0,2})"             # 3: символ в кодовой странице \'hh
+    rb"|\\([^a-zA-Z'])"                     # 4: управляющий символ
+    rb"|(\\)"                                # 5: обратная косая черта в конце буфера
+    rb"|([{}])"                              # 6: группа
+    rb"|([^\\{}]+)",                         # 7: текст
+    re.S)
+
+_RTF_DESTINATIONS = frozenset("""
+aftncn aftnsep aftnsepc annotation atnauthor atndate atnicn atnid atnparent atnref atntime atrfend
+atrfstart author background bkmkend bkmkstart blipuid buptim category colorschememapping colortbl
+comment company creatim datafield datastore defchp defpap do doccomm docvar dptxbxtext ebcend ebcstart
+factoidname falt fchars ffdeftext ffentrymcr ffexitmcr ffformat ffhelptext ffl ffname ffstattext
+file filetbl fldinst fldtype fname fontemb fontfile fonttbl footer footerf footerl footerr
+footnote formfield ftncn ftnsep ftnsepc g generator gridtbl header headerf headerl headerr hl hlfr
+hlinkbase hlloc hlsrc hsv htmltag info keycode keywords latentstyles lchars levelnumbers leveltext
+lfolevel linkval list listlevel listname listoverride listoverridetable listpicture liststylename
+listtable listtext lsdlockedexcept macc maccPr mailmerge maln malnScr manager margPr mbar mbarPr
+mbaseJc mbegChr mborderBox mborderBoxPr mbox mboxPr mchr mcount mctrlPr md mdeg mdegHide mden mdiff
+mdPr me mendChr meqArr meqArrPr mf mfName mfPr mfunc mfuncPr mgroupChr mgroupChrPr mgrow mhideBot
+mhideLeft mhideRight mhideTop mhtmltag mlim mlimloc mlimlow mlimlowPr mlimupp mlimuppPr mm
+mmaddfieldname mmath mmathPict mmathPr mmaxdist mmc mmcJc mmconnectstr mmconnectstrdata mmcPr mmcs
+mmdatasource mmheadersource mmmailsubject mmodso mmodsofilter mmodsofldmpdata mmodsomappedname
+mmodsoname mmodsorecipdata mmodsosort mmodsosrc mmodsotable mmodsoudl mmodsoudldata mmodsouniquetag
+mmPr mmquery mmr mnary mnaryPr mnoBreak mnum mobjDist moMath moMathPara moMathParaPr mopEmu mphant
+mphantPr mplcHide mpos mr mrad mradPr mrPr msepChr mshow mshp msPre msPrePr msSub msSubPr msSubSup
+msSubSupPr msSup msSupPr mstrikeBLTR mstrikeH mstrikeTLBR mstrikeV msub msubHide msup msupHide
+mtransp mtype mvertJc mvfmf mvfml mvtof mvtol mzeroAsc mzeroDesc mzeroWid nesttableprops nextfile
+nonesttables objalias objclass objdata object objname objsect objtime oldcprops oldpprops oldsprops
+oldtprops oleclsid operator panose password passwordhash pgp pgptbl picprop pict pn pnseclvl pntext
+pntxta pntxtb printim private propname protend protstart protusertbl pxe result revtbl revtim
+rsidtbl rxe shp shpgrp shpinst shppict shprslt shptxt sn sp staticval stylesheet subject sv svb tc
+template themedata title txe ud upr userprops wgrffmtfilter windowcaption writereservation
+writereservhash xe xform xmlattrname xmlattrvalue xmlclose xmlname xmlnstbl xmlopen
+""".split())
+
+_RTF_SPECIAL_WORDS = {
+    'par': '\n', 'sect': '\n\n', 'page': '\n\n', 'line': '\n', 'tab': '\t', 'row': '\n',
+    'cell': '|', 'nestcell': '|', 'emdash': '\u2014', 'endash': '\u2013', 'emspace': '\u2003',
+    'enspace': '\u2002', 'qmspace': '\u2005', 'bullet': '\u2022', 'lquote': '\u2018',
+    'rquote': '\u2019', 'ldblquote': '\u201C', 'rdblquote': '\u201D',
+}
+
+_RTF_SPECIAL_SYMBOLS = {b'~': '\xa0', b'_': '-', b'\\': '\\', b'{': '{', b'}': '}', b'\n': '\n', b'\r': '\n'}
+
+
+class RtfTextCounter:
+    """Потоковый подсчет слов и символов в RTF: данные передаются через feed() блоками."""
+    def __init__(self):
+        self.stats = TextStats()
+        self.codepage = 'cp1252'
+        self._buffer = b''
+        self._stack = []
+        self._skip = False       # текущая группа пропускается
+        self._uc = 1             # число символов замены после \uN
+        self._fallback = 0       # сколько символов замены осталось пропустить
+        self._bin = 0            # сколько байт двоичных данных осталось пропустить
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+        self._process(final=False)
+
+    def close(self) -> TextStats:
+        self._process(final=True)
+        return self.stats
+
+    def _text(self, text: str) -> None:
+        if self._fallback:
+            skipped = min(self._fallback, len(text))
+            text = text[skipped:]
+            self._fallback -= skipped
+        self.stats.feed(text)
+
+    def _process(self, final: bool) -> None:
+        buf = self._buffer
+        pos, end = 0, len(buf)
+        while pos < end:
+            if self._bin:
+                skipped = min(self._bin, end - pos)
+                self._bin -= skipped
+                pos += skipped
+                continue
+            m = _RTF_TOKEN.match(buf, pos)
+            kind = m.lastindex
+            # Незавершенный токен в конце буфера дочитываем со следующим блоком
+            if not final and m.end() == end and (kind in (1, 2, 5) or (kind == 3 and len(m.group(3)) < 2)):
+                break
+            pos = m.end()
+
+            if kind == 7:
+                if not self._skip:
+                    self._text(m.group(7).replace(b'\r', b'').replace(b'\n', b'').decode(self.codepage, errors='replace'))
+            elif kind == 6:
+                if m.group(6) == b'{':
+                    self._stack.append((self._skip, self._uc))
+                elif self._stack:
+                    self._skip, self._uc = self._stack.pop()
+            elif kind in (1, 2):
+                self._control_word(m.group(1).decode('ascii'), m.group(2))
+            elif kind == 3:
+                if not self._skip and m.group(3):
+                    if self._fallback:
+                        self._fallback -= 1
+                    else:
+                        self.stats.feed(bytes.fromhex(m.group(3).decode('ascii').zfill(2)).decode(self.codepage, errors='replace'))
+            elif kind == 4:
+                symbol = m.group(4)
+                if symbol == b'*':
+                    self._skip = True
+                elif not self._skip and symbol in _RTF_SPECIAL_SYMBOLS:
+                    self._text(_RTF_SPECIAL_SYMBOLS[symbol])
+        self._buffer = buf[pos:]
+
+    def _control_word(self, word: str, param: bytes) -> None:
+        if word == 'bin':
+            self._bin = max(int(param or 0), 0)
+        elif self._skip:
+            return
+        elif word in _RTF_DESTINATIONS:
+            self._skip = True
+        elif word in _RTF_SPECIAL_WORDS:
+            self._text(_RTF_SPECIAL_WORDS[word])
+        elif word == 'uc':
+            self._uc = int(param or 1)
+        elif word == 'u':
+            code = int(param or 0)
+            self.stats.feed(chr(code + 0x10000 if code < 0 else code))
+            self._fallback = self._uc
+        elif word == 'ansicpg':
+            codepage = f'cp{int(param or 1252)}'
+            try:
+                ''.encode(codepage)
+                self.codepage = codepage
+            except LookupError:
+                pass
+
+
+def count_rtf_text(file_path: str) -> RtfTextCounter:
+    """Считает слова и символы в RTF-файле, читая его блоками."""
+    counter = RtfTextCounter()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(_RTF_READ_SIZE)
+            if not chunk:
+                break
+            counter.feed(chunk)
+    counter.close()
+    return counter
@@ -0,0 +1,366 @@
+# Разбор заголовков TIFF без декодирования изображения
+#
+# Читается только цепочка IFD (каталогов тегов): для каждой страницы - два
+# небольших чтения (число записей и сами записи) и, при необходимости, чтение
+# значений нужных тегов. Пиксельные данные не читаются, поэтому стоимость не
+# зависит от размера изображения. Поддерживаются классический TIFF, BigTIFF и
+# RAW-форматы на основе TIFF (CR2, NEF, RW2).
+
+import io
+import struct
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Ограничения, защищающие от поврежденных и зацикленных файлов
+MAX_IFDS = 10000
+MAX_ENTRIES = 4096
+MAX_VALUE_SIZE = 64 * 1024
+
+# Теги
+NEW_SUBFILE_TYPE = 254
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+IMAGE_DESCRIPTION = 270
+MAKE = 271
+MODEL = 272
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+X_RESOLUTION = 282
+Y_RESOLUTION = 283
+RESOLUTION_UNIT = 296
+SOFTWARE = 305
+DATE_TIME = 306
+ARTIST = 315
+HOST_COMPUTER = 316
+TILE_WIDTH = 322
+SUB_IFDS = 330
+COPYRIGHT = 33432
+EXIF_IFD = 34665
+
+# Теги EXIF, извлекаемые для RAW-файлов
+EXIF_TAGS = {
+    33434: 'exposure_time',
+    33437: 'f_number',
+    34855: 'iso',
+    36867: 'date_original',
+    37386: 'focal_length',
+    40962: 'pixel_x',
+    40963: 'pixel_y',
+    42036: 'lens_model',
+}
+
+# Теги IFD0 Panasonic RW2
+RW2_SENSOR_WIDTH = 0x0002
+RW2_SENSOR_HEIGHT = 0x0003
+RW2_BORDERS = (0x0004, 0x0005, 0x0006, 0x0007)  # верх, лево, низ, право
+RW2_BITS_PER_SAMPLE = 0x000A
+RW2_ISO = 0x0017
+RW2_TAGS = frozenset((RW2_SENSOR_WIDTH, RW2_SENSOR_HEIGHT, RW2_BITS_PER_SAMPLE, RW2_ISO) + RW2_BORDERS)
+
+# Фотометрия необработанных данных сенсора: CFA и LinearRaw
+_RAW_PHOTOMETRIC = (32803, 34892)
+
+# Теги, значения которых читаются для описания страницы
+PAGE_TAGS = frozenset((NEW_SUBFILE_TYPE, IMAGE_WIDTH, IMAGE_LENGTH, BITS_PER_SAMPLE, COMPRESSION, PHOTOMETRIC,
+                       SAMPLES_PER_PIXEL, X_RESOLUTION, Y_RESOLUTION, RESOLUTION_UNIT, TILE_WIDTH, SUB_IFDS))
+
+# Текстовые теги (имена как в метаданных ImageMagick)
+TEXT_TAGS = {
+    IMAGE_DESCRIPTION: 'tiff:image-description',
+    MAKE: 'tiff:make',
+    MODEL: 'tiff:model',
+    SOFTWARE: 'tiff:software',
+    DATE_TIME: 'tiff:timestamp',
+    ARTIST: 'tiff:artist',
+    HOST_COMPUTER: 'tiff:hostcomputer',
+    COPYRIGHT: 'tiff:copyright',
+}
+
+# Тип поля -> (размер элемента, формат struct)
+_FIELD_TYPES = {
+    1: (1, 'B'), 2: (1, 's'), 3: (2, 'H'), 4: (4, 'I'), 5: (8, 'II'), 6: (1, 'b'), 7: (1, 'B'),
+    8: (2, 'h'), 9: (4, 'i'), 10: (8, 'ii'), 11: (4, 'f'), 12: (8, 'd'), 13: (4, 'I'),
+    16: (8, 'Q'), 17: (8, 'q'), 18: (8, 'Q'),
+}
+
+# Сигнатуры: 42 - TIFF, 43 - BigTIFF, 0x55 - Panasonic RW2
+_MAGIC_TIFF = 42
+_MAGIC_BIGTIFF = 43
+_MAGIC_RW2 = 0x55
+
+# Код сжатия TIFF -> имя сжатия в терминах ImageMagick (ключи COMPRESSION_MAP)
+COMPRESSION_NAMES = {
+    1: 'no', 2: 'fax', 3: 'fax', 4: 'group4', 5: 'lzw', 6: 'jpeg', 7: 'jpeg', 8: 'zip',
+    32773: 'rle', 32946: 'zip', 34712: 'jpeg2000', 34925: 'lzma', 50000: 'zstd', 50001: 'webp',
+    34316: 'Panasonic RAW', 34713: 'Nikon NEF',
+}
+
+# PhotometricInterpretation -> цветовое пространство в терминах ImageMagick
+PHOTOMETRIC_NAMES = {
+    0: 'gray', 1: 'gray', 2: 'srgb', 3: 'srgb', 4: 'gray', 5: 'cmyk', 6: 'ycbcr',
+    8: 'lab', 9: 'lab', 10: 'lab', 32803: 'RAW (CFA)', 34892: 'rgb',
+}
+
+
+class TiffFormatError(ValueError):
+    """Файл не является TIFF или его структура повреждена."""
+
+
+class TiffReader:
+    """Чтение каталогов (IFD) TIFF из открытого двоичного файла."""
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        header = self._read_at(0, 16)
+        if header[:2] == b'II':
+            self.byte_order = '<'
+        elif header[:2] == b'MM':
+            self.byte_order = '>'
+        else:
+            raise TiffFormatError("Неверная сигнатура TIFF")
+        self.magic = struct.unpack(self.byte_order + 'H', header[2:4])[0]
+        if self.magic == _MAGIC_BIGTIFF:
+            self.bigtiff = True
+            self.first_ifd = struct.unpack(self.byte_order + 'Q', header[8:16])[0]
+        elif self.magic in (_MAGIC_TIFF, _MAGIC_RW2):
+            self.bigtiff = False
+            self.first_ifd = struct.unpack(self.byte_order + 'I', header[4:8])[0]
+        else:
+            raise TiffFormatError(f"Неизвестная версия TIFF: {self.magic}")
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        self.f.seek(offset)
+        data = self.f.read(size)
+        if len(data) < size:
+            raise TiffFormatError("Неожиданный конец файла")
+        return data
+
+    def read_ifd(self, offset: int, tags: Optional[Iterable[int]] = None) -> Tuple[Dict[int, Any], int]:
+        """Читает IFD по смещению. Возвращает (значения тегов, смещение следующего IFD).
+
+        Если задан tags, значения, не помещающиеся в запись, читаются только для этих тегов.
+        """
+        tags = frozenset(tags) if tags is not None else None
+        bo = self.byte_order
+        if self.bigtiff:
+            count_size, entry_size, offset_size, offset_format = 8, 20, 8, 'Q'
+        else:
+            count_size, entry_size, offset_size, offset_format = 2, 12, 4, 'I'
+
+        count = struct.unpack(bo + ('Q' if self.bigtiff else 'H'), self._read_at(offset, count_size))[0]
+        if count > MAX_ENTRIES:
+            raise TiffFormatError(f"Слишком много записей в IFD: {count}")
+        raw = self._read_at(offset + count_size, count * entry_size + offset_size)
+
+        values = {}
+        for i in range(count):
+            entry = raw[i * entry_size:(i + 1) * entry_size]
+            tag, field_type = struct.unpack(bo + 'HH', entry[:4])
+            n = struct.unpack(bo + offset_format, entry[4:4 + offset_size])[0]
+            if field_type not in _FIELD_TYPES:
+                continue
+            item_size, item_format = _FIELD_TYPES[field_type]
+            size = item_size * n
+            if size <= offset_size:
+                data = entry[4 + offset_size:4 + offset_size + size]
+            elif (tags is None or tag in tags) and size <= MAX_VALUE_SIZE:
+                data = self._read_at(struct.unpack(bo + offset_format, entry[4 + offset_size:])[0], size)
+            else:
+                continue
+            values[tag] = self._decode(data, field_type, n)
+
+        next_offset = struct.unpack(bo + offset_format, raw[count * entry_size:])[0]
+        return values, next_offset
+
+    def _decode(self, data: bytes, field_type: int, n: int) -> Any:
+        if field_type == 2:
+            return data.split(b'\x00', 1)[0].decode('utf-8', errors='replace').strip()
+        if field_type == 7:
+            return data
+        item_size, item_format = _FIELD_TYPES[field_type]
+        items = struct.unpack(self.byte_order + item_format * n, data)
+        if field_type in (5, 10):
+            return tuple(items[i] / items[i + 1] if items[i + 1] else 0.0 for i in range(0, len(items), 2))
+        return items
+
+    def iter_ifds(self, offset: Optional[int] = None, tags: Optional[Iterable[int]] = None,
+                  max_ifds: int = MAX_IFDS) -> Iterator[Tuple[int, Dict[int, Any]]]:
+        """Проходит по цепочке IFD, начиная с offset (по умолчанию - с первого)."""
+        offset = self.first_ifd if offset is None else offset
+        seen = set()
+        while offset and offset not in seen and len(seen) < max_ifds:
+            seen.add(offset)
+            values, next_offset = self.read_ifd(offset, tags)
+            yield offset, values
+            offset = next_offset
+
+
+def _first(values: Dict[int, Any], tag: int, default: Any = None) -> Any:
+    value = values.get(tag)
+    if isinstance(value, tuple):
+        return value[0] if value else default
+    return default if value is None else value
+
+
+def describe_ifd(values: Dict[int, Any]) -> Dict[str, Any]:
+    """Описание страницы (IFD): размеры, глубина, сжатие, разрешение."""
+    compression = _first(values, COMPRESSION, 1)
+    return {
+        'width': _first(values, IMAGE_WIDTH),
+        'height': _first(values, IMAGE_LENGTH),
+        'bits_per_sample': _first(values, BITS_PER_SAMPLE, 1),
+        'samples_per_pixel': _first(values, SAMPLES_PER_PIXEL, 1),
+        'compression_code': compression,
+        'compression': COMPRESSION_NAMES.get(compression, str(compression)),
+        'photometric': _first(values, PHOTOMETRIC),
+        'x_resolution': _first(values, X_RESOLUTION),
+        'y_resolution': _first(values, Y_RESOLUTION),
+        'resolution_unit': _first(values, RESOLUTION_UNIT, 2),
+        'reduced': bool(_first(values, NEW_SUBFILE_TYPE, 0) & 1),
+        'tiled': TILE_WIDTH in values,
+    }
+
+
+def read_tiff_pages(source, max_pages: int = MAX_IFDS) -> Dict[str, Any]:
+    """Читает структуру TIFF: список страниц (IFD) с уровнями пирамиды (SubIFD).
+
+    source - путь к файлу, содержимое в памяти (bytes) или открытый двоичный файл.
+    """
+    return _with_source(source, _read_tiff_pages, max_pages)
+
+
+def _with_source(source, func, *args):
+    """Вызывает func(f, *args) для пути, содержимого в памяти или открытого файла."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return func(io.BytesIO(source), *args)
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return func(f, *args)
+    return func(source, *args)
+
+
+def _read_tiff_pages(f: BinaryIO, max_pages: int) -> Dict[str, Any]:
+    reader = TiffReader(f)
+    wanted = PAGE_TAGS | frozenset(TEXT_TAGS)
+    pages: List[Dict[str, Any]] = []
+    text_tags: Dict[str, str] = {}
+    truncated = False
+    try:
+        for offset, values in reader.iter_ifds(tags=wanted, max_ifds=max_pages):
+            page = describe_ifd(values)
+            page['levels'] = []
+            # Уровни пирамиды, записанные как SubIFD
+            for sub_offset in values.get(SUB_IFDS, ()):
+                for _, sub_values in reader.iter_ifds(sub_offset, tags=PAGE_TAGS, max_ifds=64):
+                    page['levels'].append(describe_ifd(sub_values))
+            if not pages:
+                text_tags = {name: values[tag] for tag, name in TEXT_TAGS.items() if isinstance(values.get(tag), str)}
+            pages.append(page)
+    except (TiffFormatError, struct.error):
+        # Поврежденная цепочка: возвращаем страницы, прочитанные до ошибки
+        if not pages:
+            raise
+        truncated = True
+    if not pages:
+        raise TiffFormatError("В файле нет ни одного IFD")
+    return {
+        'byte_order': 'little-endian' if reader.byte_order == '<' else 'big-endian',
+        'bigtiff': reader.bigtiff,
+        'pages': pages,
+        'tags': text_tags,
+        'truncated': truncated,
+    }
+
+
+def read_raw_info(source) -> Dict[str, Any]:
+    """Читает параметры RAW-файла на основе TIFF (CR2, NEF, RW2) из заголовков и EXIF.
+
+    Данные сенсора не декодируются. Возвращает формат, размеры, битовую глубину,
+    сжатие, разрешение и сведения о камере.
+    """
+    return _with_source(source, _read_raw_info)
+
+
+def _read_sof3(reader: TiffReader, offset: int) -> Optional[Tuple[int, int, int]]:
+    """Читает заголовок lossless JPEG (SOF3) данных сенсора CR2: (точность, высота, ширина * компоненты)."""
+    reader.f.seek(offset)
+    data = reader.f.read(4096)
+    pos = data.find(b'\xff\xc3')
+    if pos < 0 or pos + 10 > len(data):
+        return None
+    precision = data[pos + 4]
+    height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+    return precision, height, width * data[pos + 9]
+
+
+def _read_raw_info(f: BinaryIO) -> Dict[str, Any]:
+    reader = TiffReader(f)
+    f.seek(8)
+    is_cr2 = f.read(2) == b'CR'
+    wanted = PAGE_TAGS | frozenset(TEXT_TAGS) | RW2_TAGS | {EXIF_IFD, STRIP_OFFSETS}
+
+    chain = [values for _, values in reader.iter_ifds(tags=wanted, max_ifds=16)]
+    if not chain:
+        raise TiffFormatError("В файле нет ни одного IFD")
+    ifd0 = chain[0]
+    images = list(chain)
+    for values in chain:
+        for sub_offset in values.get(SUB_IFDS, ()):
+            images.extend(sub_values for _, sub_values in reader.iter_ifds(sub_offset, tags=wanted, max_ifds=16))
+
+    exif = {}
+    exif_offset = _first(ifd0, EXIF_IFD)
+    if exif_offset:
+        exif_values, _ = reader.read_ifd(exif_offset, tags=EXIF_TAGS)
+        exif = {name: _first(exif_values, tag) for tag, name in EXIF_TAGS.items() if tag in exif_values}
+
+    make = ifd0.get(MAKE, '') if isinstance(ifd0.get(MAKE), str) else ''
+    model = ifd0.get(MODEL, '') if isinstance(ifd0.get(MODEL), str) else ''
+    page0 = describe_ifd(ifd0)
+    info = {
+        'make': make,
+        'model': model,
+        'x_resolution': page0['x_resolution'],
+        'y_resolution': page0['y_resolution'],
+        'resolution_unit': page0['resolution_unit'],
+    }
+
+    if reader.magic == _MAGIC_RW2:
+        top, left, bottom, right = (_first(ifd0, tag, 0) for tag in RW2_BORDERS)
+        info.update(format='RW2',
+                    width=(right - left) or _first(ifd0, RW2_SENSOR_WIDTH),
+                    height=(bottom - top) or _first(ifd0, RW2_SENSOR_HEIGHT),
+                    bit_depth=_first(ifd0, RW2_BITS_PER_SAMPLE),
+                    compression='Panasonic RAW')
+        if 'iso' not in exif and RW2_ISO in ifd0:
+            exif['iso'] = _first(ifd0, RW2_ISO)
+    else:
+        raw = next((describe_ifd(values) for values in images if _first(values, PHOTOMETRIC) in _RAW_PHOTOMETRIC), None)
+        if is_cr2:
+            info.update(format='CR2', compression='losslessjpeg')
+            sof3 = _read_sof3(reader, _first(chain[3], STRIP_OFFSETS)) if len(chain) > 3 and STRIP_OFFSETS in chain[3] else None
+            if sof3:
+                info['bit_depth'] = sof3[0]
+        elif raw is not None:
+            info.update(format='NEF' if make.upper().startswith('NIKON') else 'TIFF RAW',
+                        width=raw['width'], height=raw['height'],
+                        bit_depth=raw['bits_per_sample'], compression=raw['compression'])
+        else:
+            info.update(format='TIFF RAW')
+
+        if not info.get('width'):
+            # Размер изображения по EXIF, иначе - самый большой IFD
+            if exif.get('pixel_x') and exif.get('pixel_y'):
+                info.update(width=exif['pixel_x'], height=exif['pixel_y'])
+            else:
+                largest = max((describe_ifd(values) for values in images),
+                              key=lambda page: (page['width'] or 0) * (page['height'] or 0))
+                info.update(width=largest['width'], height=largest['height'])
+                info.setdefault('bit_depth', largest['bits_per_sample'])
+                info.setdefault('compression', largest['compression'])
+
+    exif.pop('pixel_x', None)
+    exif.pop('pixel_y', None)
+    info['camera'] = exif
+    return info
@@ -1,5 +1,11 @@
 import re, os
 
+# Исключаем из обработки при обработке директорий (выходные файлы программы и каталог)
+SKIP_EXT = ('.txt', '.xml', '.sqlite', '.sqlite-wal', '.sqlite-shm')
+
+# Сетевые файловые системы (изменения с других узлов не видны inotify)
+NETWORK_FS_TYPES = ('cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'fuse.sshfs', '9p')
+
 # Вспомогательные функции
 def convert_bytes(num: float) -> str:
     """Конвертирует байты в читаемый формат (KB, MB, GB) с точностью до сотых."""
@@ -60,8 +66,21 @@ def replace_eng_with_rus(text):
     pattern = re.compile(r'[A-Za-z]')
     return pattern.sub(replace_match, text)
 
-
-
-
-
-
+def get_mount(path: str) -> tuple:
+    """Точка монтирования и тип файловой системы для пути (Linux, по /proc/mounts)."""
+    path = os.path.realpath(path)
+    best = ('/', '')
+    try:
+        with open('/proc/mounts', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Пробелы в пути экранируются как \040
+                mount_point = fields[1].replace('\\040', ' ')
+                prefix = mount_point.rstrip('/') + '/'
+                if (path == mount_point or path.startswith(prefix)) and len(mount_point) >= len(best[0]):
+                    best = (mount_point, fields[2])
+    except OSError:
+        return os.path.splitdrive(path)[0] or '/', ''
+    return best
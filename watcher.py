@@ -0,0 +1,347 @@
+# Наблюдение за папкой приема файлов
+#
+# Режим постоянной работы: новые и измененные файлы в папке (и подпапках)
+# обнаруживаются через inotify (Linux) или периодическим обходом папки.
+# Файл ставится в конвейер обработки (pipeline.py), когда его размер и время
+# изменения не меняются STABLE_SECONDS секунд (копирование завершено).
+# Число файлов в обработке (от постановки в конвейер до записи описания)
+# ограничено семафором; обработанные файлы не хранятся в памяти - повторную
+# обработку предотвращает свежее XML-описание рядом с файлом.
+# Запись каталога сохраняется сразу после обработки файла (поступление файлов
+# может быть редким); SIGTERM завершает наблюдение с сохранением каталога.
+#
+# Запуск:
+#   python watcher.py /mnt/intake --topo "Цифровой репозиторий" [--catalog catalog.sqlite] [--poll]
+
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import signal
+import struct
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+from catalog import Catalog
+from output_writer import start_queue_logging
+from pipeline import PipelineScheduler, PipelineJob
+from utils import SKIP_EXT, NETWORK_FS_TYPES, get_mount
+
+# Файл считается готовым, если не менялся столько секунд
+STABLE_SECONDS = 10
+# Период проверки готовности файлов и обхода папки в режиме опроса, секунд
+CHECK_INTERVAL = 2
+POLL_INTERVAL = 30
+# Ограничение числа файлов в обработке одновременно
+MAX_PENDING = 16
+# Сколько файлов с ошибкой обработки помнить (чтобы не обрабатывать их повторно при каждом обходе)
+FAILED_LIMIT = 10000
+
+# Временные файлы копирования не обрабатываются
+TEMP_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload', '~')
+
+# Константы inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT = struct.Struct('iIII')
+
+
+def is_candidate(file_path: str) -> bool:
+    """Нужно ли обрабатывать файл (не выходной файл программы и не временный файл)."""
+    name = os.path.basename(file_path)
+    return not (name.startswith('.') or name.endswith(SKIP_EXT) or name.lower().endswith(TEMP_SUFFIXES))
+
+
+def iter_files(folder_path: str) -> Iterator[str]:
+    """Все файлы-кандидаты в папке и подпапках."""
+    for roots, _, files in os.walk(folder_path):
+        for file in files:
+            file_path = os.path.join(roots, file)
+            if is_candidate(file_path):
+                yield file_path
+
+
+def sidecar_path(file_path: str) -> str:
+    """Путь к XML-описанию файла (рядом с файлом, как при обработке папки в gui.py)."""
+    return os.path.splitext(file_path)[0] + ".xml"
+
+
+class InotifyWatcher:
+    """Наблюдение за деревом папок через inotify (ctypes, без сторонних библиотек)."""
+    def __init__(self, folder_path: str, on_path, on_overflow):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.on_path = on_path
+        self.on_overflow = on_overflow
+        self._dirs: Dict[int, str] = {}
+        self.add_tree(folder_path)
+
+    def add_tree(self, folder_path: str):
+        """Добавляет наблюдение за папкой и всеми подпапками; уже лежащие там файлы передаются в on_path."""
+        for roots, dirs, files in os.walk(folder_path):
+            wd = self._add_watch(self.fd, os.fsencode(roots), _WATCH_MASK)
+            if wd < 0:
+                logging.warning(f"Не удалось наблюдать за папкой {roots}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._dirs[wd] = roots
+            for file in files:
+                self.on_path(os.path.join(roots, file))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        loop.add_reader(self.fd, self._read_events)
+
+    def close(self, loop: asyncio.AbstractEventLoop):
+        loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\x00')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # События потеряны: повторный обход всего дерева
+                self.on_overflow()
+                continue
+            folder = self._dirs.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._dirs[wd]
+                continue
+            if not name:
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+            else:
+                self.on_path(path)
+
+
+class FolderWatcher:
+    """Отслеживает файлы в папке и передает готовые (стабильные) файлы в конвейер."""
+    def __init__(self, folder_path: str, topo: str, catalog: Optional[Catalog] = None, poll: bool = False,
+                 stable_seconds: float = STABLE_SECONDS, poll_interval: float = POLL_INTERVAL,
+                 max_pending: int = MAX_PENDING, process_existing: bool = True):
+        self.folder_path = os.path.abspath(folder_path)
+        self.topo = topo
+        self.catalog = catalog
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.max_pending = max_pending
+        self.process_existing = process_existing
+        mount_point, fs_type = get_mount(self.folder_path)
+        # На сетевых ресурсах inotify не видит изменений, сделанных другими узлами
+        self.poll = poll or not sys.platform.startswith('linux') or fs_type in NETWORK_FS_TYPES
+        # Файлы-кандидаты: путь -> (размер, время изменения, время последнего изменения этих значений)
+        self._pending: Dict[str, Tuple[int, float, float]] = {}
+        # Файлы в обработке: путь -> (размер, время изменения)
+        self._in_flight: Dict[str, Tuple[int, float]] = {}
+        # Файлы, обработка которых завершилась ошибкой (ограниченный LRU)
+        self._failed: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._ready: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Освободилось место в очереди готовых - проверить файлы, не дожидаясь CHECK_INTERVAL
+        self._wakeup: Optional[asyncio.Event] = None
+        # Время запуска: файлы, не менявшиеся с запуска, пропускаются при process_existing=False
+        self._started_at = time.time()
+
+    def _stat(self, file_path: str) -> Optional[Tuple[int, float]]:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def notice(self, file_path: str, state: Optional[Tuple[int, float]] = None):
+        """Отмечает файл как новый или измененный."""
+        if not is_candidate(file_path):
+            return
+        state = state or self._stat(file_path)
+        if state is None:
+            self._pending.pop(file_path, None)
+            self._failed.pop(file_path, None)
+            return
+        if self._in_flight.get(file_path) == state or self._failed.get(file_path) == state:
+            return
+        previous = self._pending.get(file_path)
+        if previous is None:
+            if not self.process_existing and state[1] < self._started_at:
+                return
+            if self._has_fresh_sidecar(file_path, state):
+                return
+        if previous is None or previous[:2] != state:
+            self._pending[file_path] = (state[0], state[1], time.monotonic())
+
+    def _has_fresh_sidecar(self, file_path: str, state: Tuple[int, float]) -> bool:
+        """Есть ли XML-описание, созданное после последнего изменения файла."""
+        try:
+            return os.path.getmtime(sidecar_path(file_path)) >= state[1]
+        except OSError:
+            return False
+
+    def scan(self) -> list:
+        """Обход всей папки: список (путь, (размер, время изменения))."""
+        return [(file_path, self._stat(file_path)) for file_path in iter_files(self.folder_path)]
+
+    def rescan(self, files: Optional[list] = None):
+        """Отмечает все файлы папки (режим опроса и потеря событий inotify)."""
+        for file_path, state in (self.scan() if files is None else files):
+            if state is not None:
+                self.notice(file_path, state)
+
+    def _collect_stable(self):
+        """Переносит файлы, не менявшиеся stable_seconds, в очередь готовых."""
+        now = time.monotonic()
+        for file_path, (size, mtime, changed) in list(self._pending.items()):
+            state = self._stat(file_path)
+            if state is None:
+                del self._pending[file_path]
+            elif state != (size, mtime):
+                self._pending[file_path] = (state[0], state[1], now)
+            elif now - changed >= self.stable_seconds:
+                if self._ready.full():
+                    # Остальные готовые файлы перейдут в очередь при следующей проверке
+                    break
+                del self._pending[file_path]
+                self._in_flight[file_path] = state
+                self._ready.put_nowait(file_path)
+
+    async def _check_loop(self):
+        while True:
+            self._collect_stable()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _poll_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            # Обход (stat по сети) - в отдельном потоке, учет файлов - в цикле событий
+            self.rescan(await loop.run_in_executor(None, self.scan))
+
+    async def _submit_loop(self, scheduler: PipelineScheduler):
+        while True:
+            file_path = await self._ready.get()
+            # Место освобождается в _on_done, когда файл обработан
+            await self._slots.acquire()
+            logging.info(f"Новый файл в папке приема: {file_path}")
+            await scheduler.submit(file_path, sidecar_path(file_path), self.topo)
+
+    def _on_done(self, job: PipelineJob):
+        self._slots.release()
+        self._wakeup.set()
+        state = self._in_flight.pop(job.file_path, None)
+        if job.error is None:
+            logging.info(f"Описание создано: {job.save_path}")
+        elif state is not None:
+            self._failed[job.file_path] = state
+            self._failed.move_to_end(job.file_path)
+            while len(self._failed) > FAILED_LIMIT:
+                self._failed.popitem(last=False)
+
+    async def run(self):
+        """Основной цикл наблюдения (до отмены задачи)."""
+        loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue(self.max_pending)
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._wakeup = asyncio.Event()
+        scheduler = PipelineScheduler(queue_size=self.max_pending, catalog=self.catalog, on_done=self._on_done)
+        await scheduler.start()
+        inotify = None
+        if not self.poll:
+            try:
+                inotify = InotifyWatcher(self.folder_path, self.notice, self.rescan)
+                inotify.start(loop)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify недоступен ({e}), используется опрос папки")
+                inotify = None
+        if inotify is None:
+            self.rescan()
+        logging.info(f"Наблюдение за папкой {self.folder_path} ({'inotify' if inotify else 'опрос'})")
+
+        tasks = [asyncio.create_task(self._check_loop()), asyncio.create_task(self._submit_loop(scheduler))]
+        if inotify is None:
+            tasks.append(asyncio.create_task(self._poll_loop()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if inotify is not None:
+                inotify.close(loop)
+            await scheduler.close()
+            if scheduler.failures:
+                logging.error(f"Не удалось обработать файлов: {len(scheduler.failures)}")
+
+
+async def _run_until_terminated(watcher: FolderWatcher):
+    """Запускает наблюдение; SIGTERM (systemd, docker stop) отменяет его, как Ctrl+C."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(watcher.run())
+    try:
+        loop.add_signal_handler(signal.SIGTERM, task.cancel)
+    except (NotImplementedError, AttributeError):  # Windows
+        pass
+    try:
+        await task
+    except asyncio.CancelledError:
+        logging.info("Наблюдение остановлено")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Наблюдение за папкой приема и создание описаний новых файлов")
+    parser.add_argument('folder', help="Папка приема файлов")
+    parser.add_argument('--topo', default="Цифровой репозиторий - Музей истории ГУЛАГа", help="Топография")
+    parser.add_argument('--catalog', help="Файл каталога метаданных SQLite")
+    parser.add_argument('--poll', action='store_true', help="Опрос папки вместо inotify")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help="Период опроса, секунд")
+    parser.add_argument('--stable', type=float, default=STABLE_SECONDS, help="Время без изменений до обработки, секунд")
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING, help="Файлов в обработке одновременно")
+    parser.add_argument('--skip-existing', action='store_true', help="Не обрабатывать файлы, лежащие в папке при запуске")
+    args = parser.parse_args(argv)
+
+    start_queue_logging(handlers=[logging.StreamHandler()])
+    # Каждая запись сохраняется сразу: она видна запросам к каталогу и не теряется при остановке
+    catalog = Catalog(args.catalog, commit_every=1) if args.catalog else None
+    watcher = FolderWatcher(args.folder, args.topo, catalog, poll=args.poll, stable_seconds=args.stable,
+                            poll_interval=args.poll_interval, max_pending=args.max_pending,
+                            process_existing=not args.skip_existing)
+    try:
+        asyncio.run(_run_until_terminated(watcher))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if catalog is not None:
+            catalog.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())